@@ -15,27 +15,58 @@ You should have received a copy of the GNU General Public License along with
 The KenGPT Project. If not, see <https://www.gnu.org/licenses/>.
 """
 
+import asyncio
 import logging
 import sys
+from contextlib import asynccontextmanager
 
 import fastapi
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
-from route.chat import ChatRouter
+from core.lifecycle import InflightMiddleware, RequestTimeMiddleware, publish_metrics_forever
+from core.store import close_store
+from route.chat import ChatCore, ChatRouter
+from route.metrics import MetricsRouter
 from route.speak import SpeakRouter
+from utils import watch_configuration
 # from route.image import ImageRouter
 
 logging.basicConfig(level=logging.DEBUG, stream=sys.stdout)
 
+
+@asynccontextmanager
+async def lifespan(app: fastapi.FastAPI):
+    """
+    Publish metrics, watch the configuration file for changes and unload
+    cold models while the worker runs. Shutdown runs once uvicorn has
+    drained the in-flight requests (see `--timeout-graceful-shutdown`), and
+    closes the assistant's toolboxes and the shared store.
+    """
+    publisher = asyncio.create_task(publish_metrics_forever())
+    watcher = asyncio.create_task(watch_configuration())
+    evictor = asyncio.create_task(
+        ChatCore.scheduler.evict_forever(lambda: ChatCore.client))
+    yield
+    publisher.cancel()
+    watcher.cancel()
+    evictor.cancel()
+    ChatCore.close()
+    close_store()
+
+
 application = fastapi.FastAPI(
     title="KenGPT Service",
     description="The KenGPT Service serves natural language processing.",
     version="0.1.0",
     root_path="/api",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
 application.include_router(ChatRouter)
 application.include_router(SpeakRouter)
+application.include_router(MetricsRouter)
 # application.include_router(ImageRouter)
 
 application.add_middleware(
@@ -44,4 +75,12 @@ application.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "X-RateLimit-Remaining-Requests",
+        "X-RateLimit-Remaining-Tokens",
+        "Retry-After",
+        "X-Batch-Id",
+    ],
 )
+application.add_middleware(InflightMiddleware)
+application.add_middleware(RequestTimeMiddleware)
@@ -0,0 +1,198 @@
+"""
+A fake Ollama server for benchmarking and testing the KenGPT service without
+a GPU. It implements the subset of the Ollama HTTP API used by the service
+(`/api/chat`, `/api/generate`, `/api/tags` and `/api/ps`) and generates
+replies at a configurable token rate after a configurable latency,
+reporting durations the way Ollama does. Models that are not loaded take
+`load_latency` seconds to load and stay loaded for their `keep_alive`.
+
+---
+
+This file is part of The KenGPT Project. The KenGPT Project is free software:
+you can redistribute it and/or modify it under the terms of the GNU General
+Public License as published by the Free Software Foundation, either version 3
+of the License, or (at your option) any later version.
+The KenGPT Project is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+details.
+You should have received a copy of the GNU General Public License along with
+The KenGPT Project. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import socket
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+@dataclass
+class FakeOllamaSettings:
+    """The behaviour of the fake backend."""
+    token_rate: float = 200.0  # Generated tokens per second
+    latency: float = 0.05  # Seconds before the first token (prompt eval)
+    reply_tokens: int = 32  # Tokens in every reply
+    load_latency: float = 0.0  # Seconds to load a model that is not loaded
+    model_size: int = 4 * 1024 ** 3  # Bytes of memory used by each model
+    models: list[str] = field(
+        default_factory=lambda: ["deepseek-r1:7b", "llama3.2:3b"])
+
+
+def parse_keep_alive(value) -> float:
+    """Return a keep-alive duration in seconds; negative means forever."""
+    if value is None:
+        return 300.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    for unit in sorted(units, key=len, reverse=True):
+        if value.endswith(unit):
+            return float(value[:-len(unit)]) * units[unit]
+    return float(value)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def create_fake_ollama(settings: FakeOllamaSettings | None = None) -> FastAPI:
+    """Create the fake Ollama application."""
+    settings = settings or FakeOllamaSettings()
+    app = FastAPI(title="Fake Ollama")
+    app.state.loaded = loaded = {}  # Model name -> expiry (monotonic seconds)
+    app.state.loads = loads = []  # Every model load, in order
+    app.state.active = 0  # Chat requests being answered
+    app.state.peak = 0  # Most chat requests answered at once
+
+    async def load(model: str, keep_alive) -> int:
+        """Load the model if needed and return the load duration in ns."""
+        duration = parse_keep_alive(keep_alive)
+        now = time.monotonic()
+        was_loaded = loaded.get(model, 0) > now
+        if duration == 0:
+            loaded.pop(model, None)
+            return 0
+        loaded[model] = now + duration if duration > 0 else float("inf")
+        if was_loaded:
+            return 0
+        loads.append(model)
+        await asyncio.sleep(settings.load_latency)
+        return int(settings.load_latency * 1e9)
+
+    @app.get("/api/tags")
+    async def tags() -> dict:
+        return {"models": [
+            {"name": name, "model": name, "modified_at": _now(),
+             "digest": "0" * 64, "size": settings.model_size}
+            for name in settings.models
+        ]}
+
+    @app.get("/api/ps")
+    async def ps() -> dict:
+        now = time.monotonic()
+        return {"models": [
+            {"name": name, "model": name, "digest": "0" * 64,
+             "size": settings.model_size, "size_vram": settings.model_size}
+            for name, expires in loaded.items() if expires > now
+        ]}
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        model = body.get("model", "")
+        if body.get("prompt"):
+            return JSONResponse(
+                {"error": "The fake only loads and unloads models."}, status_code=501)
+        load_ns = await load(model, body.get("keep_alive"))
+        unloading = parse_keep_alive(body.get("keep_alive")) == 0
+        return {"model": model, "created_at": _now(), "response": "",
+                "done": True, "done_reason": "unload" if unloading else "load",
+                "load_duration": load_ns, "total_duration": load_ns}
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        model = body.get("model", "")
+        prompt_tokens = sum(
+            len(str(m.get("content", "")).split())
+            for m in body.get("messages", []))
+        tokens = [f"token{i} " for i in range(settings.reply_tokens)]
+        interval = 1 / settings.token_rate
+        eval_ns = int(settings.reply_tokens * interval * 1e9)
+        prompt_ns = int(settings.latency * 1e9)
+        load_ns = await load(model, body.get("keep_alive"))
+
+        def chunk(content: str, done: bool) -> dict:
+            data = {
+                "model": model,
+                "created_at": _now(),
+                "message": {"role": "assistant", "content": content},
+                "done": done,
+            }
+            if done:
+                data.update(
+                    done_reason="stop",
+                    total_duration=load_ns + prompt_ns + eval_ns,
+                    load_duration=load_ns,
+                    prompt_eval_count=prompt_tokens,
+                    prompt_eval_duration=prompt_ns,
+                    eval_count=settings.reply_tokens,
+                    eval_duration=eval_ns,
+                )
+            return data
+
+        app.state.active += 1
+        app.state.peak = max(app.state.peak, app.state.active)
+        if not body.get("stream", True):
+            try:
+                await asyncio.sleep(settings.latency + settings.reply_tokens * interval)
+            finally:
+                app.state.active -= 1
+            return chunk("<think>Thinking.</think>" + "".join(tokens), True)
+
+        async def stream():
+            try:
+                await asyncio.sleep(settings.latency)
+                for token in tokens:
+                    await asyncio.sleep(interval)
+                    yield json.dumps(chunk(token, False)) + "\n"
+                yield json.dumps(chunk("", True)) + "\n"
+            finally:
+                app.state.active -= 1
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    return app
+
+
+def free_port() -> int:
+    """Return a TCP port on localhost that is currently free."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve_in_thread(app, port: int) -> uvicorn.Server:
+    """
+    Serve an ASGI application on localhost from a daemon thread and wait
+    until it accepts connections. Set `should_exit` on the returned server
+    to stop it.
+    """
+    server = uvicorn.Server(uvicorn.Config(
+        app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Server on port {port} did not start.")
+        time.sleep(0.01)
+    return server
@@ -0,0 +1,303 @@
+"""
+The benchmark suite drives the KenGPT service against a fake Ollama backend
+and a fake speech synthesizer, so results are reproducible on any machine.
+Each endpoint is exercised at several concurrency levels, and the p50, p95
+and p99 latency, time-to-first-byte and throughput are reported. After a
+few discarded warm-up requests, each measurement is repeated and the median
+of the runs is kept. The p50 and p95 latency and the throughput are
+compared against a stored baseline and the run fails on regressions.
+The p99 of a few dozen requests is a single sample, so it is reported but
+not compared.
+
+Run from the `service` directory:
+
+    python -m bench.run
+    python -m bench.run --concurrency 1 8 32 --requests 100
+    python -m bench.run --update-baseline
+
+---
+
+This file is part of The KenGPT Project. The KenGPT Project is free software:
+you can redistribute it and/or modify it under the terms of the GNU General
+Public License as published by the Free Software Foundation, either version 3
+of the License, or (at your option) any later version.
+The KenGPT Project is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+details.
+You should have received a copy of the GNU General Public License along with
+The KenGPT Project. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import statistics
+import sys
+import time
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Callable
+
+import httpx
+
+from bench.fake_ollama import (
+    FakeOllamaSettings, create_fake_ollama, free_port, serve_in_thread)
+
+BASELINE_FILE = Path(__file__).with_name("baseline.json")
+
+
+@dataclass
+class Scenario:
+    """A single endpoint exercised by the benchmark."""
+    name: str
+    method: str
+    path: str
+    body: Callable[[int], dict] | None = None  # The body of the request with an index
+
+
+def chat_body(index: int = 0, history_turns: int = 10) -> dict:
+    """
+    A `ChatRequest` body with a history of the given length. Bodies with
+    different indexes ask different questions, so they are not coalesced.
+    """
+    now = int(time.time() * 1000)
+    history = [
+        {
+            "role": "user" if i % 2 == 0 else "assistant",
+            "contents": [{"format": "text", "content": f"Message number {i}."}],
+            "timestamp": now,
+        }
+        for i in range(history_turns)
+    ]
+    return {
+        "role": "user",
+        "contents": [{"format": "text", "content": f"Hello, world! ({index})"}],
+        "timestamp": now,
+        "profile": {"botname": "KenGPT", "instruction": "Be brief."},
+        "history": history,
+    }
+
+
+SCENARIOS = [
+    Scenario("chat", "POST", "/chat", chat_body),
+    # Every request asks the same question, measuring request coalescing
+    Scenario("chat_coalesced", "POST", "/chat", lambda index: chat_body()),
+    Scenario("chat_models", "GET", "/chat/models"),
+    Scenario("speak", "POST", "/speak",
+             lambda index: {"text": f"Hello from the benchmark ({index})."}),
+]
+
+
+@dataclass
+class Result:
+    """The measurements of one scenario at one concurrency level."""
+    requests: int
+    errors: int
+    p50: float
+    p95: float
+    p99: float
+    ttfb_p50: float
+    ttfb_p95: float
+    throughput: float  # Successful requests per second
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Return the nearest-rank percentile of the values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+async def drive(client: httpx.AsyncClient, scenario: Scenario,
+                concurrency: int, total: int) -> Result:
+    """Send `total` requests for the scenario with `concurrency` in flight."""
+    latencies: list[float] = []
+    ttfbs: list[float] = []
+    errors = 0
+    sent = 0
+
+    async def worker():
+        nonlocal sent, errors
+        while sent < total:
+            body = scenario.body(sent) if scenario.body else None
+            sent += 1
+            start = time.perf_counter()
+            try:
+                async with client.stream(
+                        scenario.method, scenario.path, json=body) as response:
+                    ttfb = None
+                    async for _ in response.aiter_raw():
+                        if ttfb is None:
+                            ttfb = time.perf_counter() - start
+                    if response.status_code >= 400:
+                        errors += 1
+                        continue
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            ttfbs.append(ttfb if ttfb is not None else latencies[-1])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return Result(
+        requests=total,
+        errors=errors,
+        p50=percentile(latencies, 50),
+        p95=percentile(latencies, 95),
+        p99=percentile(latencies, 99),
+        ttfb_p50=percentile(ttfbs, 50),
+        ttfb_p95=percentile(ttfbs, 95),
+        throughput=len(latencies) / elapsed if elapsed else 0.0,
+    )
+
+
+def median_result(results: list[Result]) -> Result:
+    """
+    Combine repeated runs into one result, taking the median of every
+    measurement and the total of errors, so a run disturbed by the machine
+    does not decide the comparison.
+    """
+    combined = {field: statistics.median(getattr(result, field) for result in results)
+                for field in asdict(results[0])}
+    combined["requests"] = sum(result.requests for result in results)
+    combined["errors"] = sum(result.errors for result in results)
+    return Result(**combined)
+
+
+def start_service(settings: FakeOllamaSettings, speak_latency: float) -> str:
+    """
+    Start the fake Ollama backend and the KenGPT service, and return the
+    base URL of the service. The speech synthesizer is replaced by one that
+    sleeps for `speak_latency` seconds and returns silence.
+    """
+    ollama_port = free_port()
+    serve_in_thread(create_fake_ollama(settings), ollama_port)
+    os.environ["OLLAMA_API_URL"] = f"http://127.0.0.1:{ollama_port}"
+
+    import app
+    import route.speak
+
+    def fake_speak_text(text: str) -> bytes:
+        time.sleep(speak_latency)
+        return b"\xff\xfb" + bytes(len(text))
+
+    route.speak.speak_text = fake_speak_text
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("uvicorn").setLevel(logging.WARNING)
+    service_port = free_port()
+    serve_in_thread(app.application, service_port)
+    return f"http://127.0.0.1:{service_port}"
+
+
+def compare(results: dict[str, dict], baseline: dict[str, dict],
+            tolerance: float) -> list[str]:
+    """
+    Return a description of every regression against the baseline. The p50
+    and p95 latency may grow and throughput may shrink by `tolerance` (a
+    fraction) before a result counts as a regression. Any errors are always
+    a regression.
+    """
+    regressions = []
+    for key, result in results.items():
+        if result["errors"]:
+            regressions.append(f"{key}: {result['errors']} failed requests")
+        expected = baseline.get(key)
+        if expected is None:
+            continue
+        for metric in ("p50", "p95"):
+            if result[metric] > expected[metric] * (1 + tolerance):
+                regressions.append(
+                    f"{key}: {metric} {result[metric] * 1000:.1f}ms > "
+                    f"baseline {expected[metric] * 1000:.1f}ms")
+        if result["throughput"] < expected["throughput"] * (1 - tolerance):
+            regressions.append(
+                f"{key}: throughput {result['throughput']:.1f}/s < "
+                f"baseline {expected['throughput']:.1f}/s")
+    return regressions
+
+
+async def run(args: argparse.Namespace) -> dict[str, dict]:
+    """Run every selected scenario at every concurrency level."""
+    base_url = start_service(
+        FakeOllamaSettings(
+            token_rate=args.token_rate,
+            latency=args.latency,
+            reply_tokens=args.reply_tokens,
+        ),
+        args.speak_latency,
+    )
+    results: dict[str, dict] = {}
+    limits = httpx.Limits(max_connections=max(args.concurrency))
+    async with httpx.AsyncClient(
+            base_url=base_url, limits=limits, timeout=120) as client:
+        for scenario in SCENARIOS:
+            if args.scenario and scenario.name not in args.scenario:
+                continue
+            for concurrency in args.concurrency:
+                if args.warmup:
+                    await drive(client, scenario, concurrency, args.warmup)
+                result = median_result([
+                    await drive(client, scenario, concurrency, args.requests)
+                    for _ in range(args.repeat)])
+                key = f"{scenario.name}@{concurrency}"
+                results[key] = asdict(result)
+                print(
+                    f"{key:<20} p50={result.p50 * 1000:8.1f}ms "
+                    f"p95={result.p95 * 1000:8.1f}ms "
+                    f"p99={result.p99 * 1000:8.1f}ms "
+                    f"ttfb={result.ttfb_p50 * 1000:8.1f}ms "
+                    f"rps={result.throughput:8.1f} errors={result.errors}")
+    return results
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("---")[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=64,
+                        help="Requests per scenario and concurrency level.")
+    parser.add_argument("--warmup", type=int, default=16,
+                        help="Discarded requests sent before each measurement.")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs per measurement; the median of each value is kept.")
+    parser.add_argument("--scenario", nargs="+",
+                        choices=[s.name for s in SCENARIOS])
+    parser.add_argument("--token-rate", type=float, default=200.0)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--reply-tokens", type=int, default=32)
+    parser.add_argument("--speak-latency", type=float, default=0.02)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_FILE)
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed fractional regression against the baseline.")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="Store these results as the new baseline.")
+    parser.add_argument("--output", type=Path,
+                        help="Write the results as JSON to this file.")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + "\n")
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
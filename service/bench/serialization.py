@@ -0,0 +1,109 @@
+"""
+A micro-benchmark of the `/chat` request and response serialization paths on
+large chat histories. It compares FastAPI's default handling (`json.loads`
+and Python-mode validation of the body, `ollama.Message` objects for every
+history entry, and `jsonable_encoder` with `json.dumps` for the response)
+with the service's fast path (pydantic-core JSON validation, plain dict
+messages, and orjson encoding).
+
+Run from the `service` directory:
+
+    python -m bench.serialization
+    python -m bench.serialization --turns 100 400 --repeat 200
+
+---
+
+This file is part of The KenGPT Project. The KenGPT Project is free software:
+you can redistribute it and/or modify it under the terms of the GNU General
+Public License as published by the Free Software Foundation, either version 3
+of the License, or (at your option) any later version.
+The KenGPT Project is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+details.
+You should have received a copy of the GNU General Public License along with
+The KenGPT Project. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import timeit
+import uuid
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from ollama import Message
+
+from core.llama_core import LlamaCore
+from model.message import ChatContent, ChatRequest, ChatResponse, Role, Status
+
+
+def large_request(turns: int, words: int = 200) -> bytes:
+    """Encode a `ChatRequest` with `turns` history messages of `words` words."""
+    text = " ".join(["lorem"] * words)
+    history = [
+        {
+            "role": "user" if i % 2 == 0 else "assistant",
+            "contents": [{"format": "text", "content": text}],
+            "thoughts": [text] if i % 2 else None,
+            "timestamp": 1_700_000_000_000 + i,
+        }
+        for i in range(turns)
+    ]
+    return json.dumps({
+        "role": "user",
+        "contents": [{"format": "text", "content": "Hello, world!"}],
+        "timestamp": 1_700_000_000_000 + turns,
+        "profile": {"botname": "KenGPT", "instruction": "Be brief."},
+        "history": history,
+    }).encode()
+
+
+def default_path(raw: bytes, response: ChatResponse) -> bytes:
+    request = ChatRequest.model_validate(json.loads(raw))
+    [Message(content=msg.render_text(), role=msg.role.value) for msg in request.history]
+    return json.dumps(jsonable_encoder(response)).encode()
+
+
+CORE = LlamaCore(system_prompt="")
+
+
+def fast_path(raw: bytes, response: ChatResponse) -> bytes:
+    request = ChatRequest.model_validate_json(raw)
+    CORE.render_history(request)
+    return orjson.dumps(response.model_dump())
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("---")[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 100, 400])
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    response = ChatResponse(
+        role=Role.Assistant,
+        contents=[ChatContent(format="text", content=" ".join(["lorem"] * 500))],
+        thoughts=[" ".join(["ipsum"] * 500)],
+        timestamp=1_700_000_000_000,
+        session_id=uuid.uuid4(),
+        status=Status.Running,
+        model_signature="deepseek-r1:7b",
+    )
+    for turns in args.turns:
+        raw = large_request(turns)
+        default = timeit.timeit(
+            lambda: default_path(raw, response), number=args.repeat) / args.repeat
+        fast = timeit.timeit(
+            lambda: fast_path(raw, response), number=args.repeat) / args.repeat
+        print(f"{turns:>5} turns ({len(raw) / 1024:7.1f} KiB): "
+              f"default={default * 1000:7.3f}ms fast={fast * 1000:7.3f}ms "
+              f"speedup={default / fast:5.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
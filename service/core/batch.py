@@ -0,0 +1,209 @@
+"""
+The batch module runs bulk chat workloads, such as nightly prompt
+evaluations, without an HTTP round trip per request. A batch is a JSONL
+body of `BatchItem` lines. Its generations are spread over every configured
+backend, a few at a time per backend in each worker process, and results are yielded as they
+finish. Each result is saved in the shared store under the batch id as soon
+as it is generated, so submitting the batch again returns the saved results
+and only generates the lines that did not finish.
+
+---
+
+This file is part of The KenGPT Project. The KenGPT Project is free software:
+you can redistribute it and/or modify it under the terms of the GNU General
+Public License as published by the Free Software Foundation, either version 3
+of the License, or (at your option) any later version.
+The KenGPT Project is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+details.
+You should have received a copy of the GNU General Public License along with
+The KenGPT Project. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import time
+from typing import AsyncIterator
+
+import anyio
+from ollama import Client
+from pydantic import ValidationError
+
+from core.llama_core import LlamaCore
+from core.metrics import BATCH_ITEMS
+from core.quota import QuotaExceeded, QuotaManager
+from core.store import get_store
+from model.message import BatchItem, ChatRequest
+from model.system import BackendSettings, BatchSettings, Configuration
+
+logger = logging.getLogger("uvicorn")
+
+BATCH_KEY_PREFIX = "batch:"
+
+
+class BatchError(Exception):
+    """Raised when a batch cannot be read."""
+
+
+def batch_key(body: bytes) -> str:
+    """Return the id of a batch body; the same body always resumes the same batch."""
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def check_id(value: str) -> str:
+    """
+    Return a batch or item id, or raise `BatchError` if it could not be told
+    apart in a result key. Keys are `batch:{batch_id}:{item_id}`, so a ":"
+    in either id would let one batch read another's results.
+    """
+    if not value or ":" in value:
+        raise BatchError(f"Invalid id {value!r}: ids must be non-empty and must not contain ':'.")
+    return value
+
+
+def parse_batch(body: bytes, max_items: int) -> list[tuple[str, ChatRequest]]:
+    """
+    Read the lines of a batch into ids and chat requests. Lines without an
+    id are named by their line number. Raise `BatchError` naming the first
+    invalid line.
+    """
+    timestamp = int(time.time() * 1000)
+    items: dict[str, ChatRequest] = {}
+    for number, line in enumerate(body.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            item = BatchItem.model_validate_json(line)
+            request = item.to_request(timestamp)
+        except (ValidationError, ValueError) as e:
+            raise BatchError(f"Line {number} is invalid: {e}")
+        item_id = item.id or str(number)
+        try:
+            check_id(item_id)
+        except BatchError as e:
+            raise BatchError(f"Line {number} is invalid: {e}")
+        if item_id in items:
+            raise BatchError(f"Line {number} repeats the id {item_id!r}.")
+        items[item_id] = request
+        if len(items) > max_items:
+            raise BatchError(f"A batch holds at most {max_items} lines.")
+    if not items:
+        raise BatchError("The batch is empty.")
+    return list(items.items())
+
+
+class BatchRunner:
+    """
+    Generates the responses of batches with a bounded number of generations
+    per backend. The bound is shared by every batch running in this worker
+    process, so a service with several workers sends up to workers ×
+    `concurrency_per_backend` batch generations to each backend. Batch
+    generations do not take the interactive generation slots, so size
+    `concurrency_per_backend` to leave the backends room for chat.
+    """
+
+    def __init__(self, core: LlamaCore, quotas: QuotaManager | None = None,
+                 settings: BatchSettings | None = None):
+        self.core = core
+        self.quotas = quotas
+        self.settings = settings or BatchSettings()
+        self.backends: list[BackendSettings] = [BackendSettings()]
+        self._clients: dict[str, Client] = {}
+        self._limiters: dict[str, anyio.CapacityLimiter] = {}
+
+    def configure(self, configuration: Configuration):
+        """
+        Apply new batch settings and backends. Running batches keep their
+        backends, but take the new concurrency limit as soon as it applies.
+        """
+        self.settings = configuration.batch
+        self.backends = configuration.backends
+        for limiter in self._limiters.values():
+            limiter.total_tokens = self.settings.concurrency_per_backend
+
+    def _client(self, url: str) -> Client:
+        if url not in self._clients:
+            self._clients[url] = Client(host=url)
+        return self._clients[url]
+
+    def _limiter(self, url: str) -> anyio.CapacityLimiter:
+        # One limiter per backend, shared by every batch in this process
+        if url not in self._limiters:
+            self._limiters[url] = anyio.CapacityLimiter(
+                self.settings.concurrency_per_backend)
+        return self._limiters[url]
+
+    def results(self, batch_id: str) -> dict[str, dict]:
+        """Return the saved results of a batch by item id."""
+        prefix = f"{BATCH_KEY_PREFIX}{batch_id}:"
+        return {key[len(prefix):]: line
+                for key, line in get_store().items(prefix).items()}
+
+    def _generate(self, batch_id: str, item_id: str, request: ChatRequest,
+                  client: Client) -> dict:
+        """
+        Admit, generate and save one result in a worker thread. Items are
+        admitted through the user's quota like any chat request, so
+        over-quota items never reach the backend. Saving here keeps a
+        finished generation even when the client has gone away.
+        """
+        if self.quotas:
+            self.quotas.acquire(request.profile.username)
+        response = self.core.get_response(request, client)
+        line = {"id": item_id, "response": response.model_dump(mode="json")}
+        get_store().set(f"{BATCH_KEY_PREFIX}{batch_id}:{item_id}", line,
+                        ttl=self.settings.result_ttl)
+        if self.quotas and response.usage:
+            self.quotas.charge(
+                request.profile.username,
+                response.usage.prompt_tokens + response.usage.completion_tokens)
+        return line
+
+    async def run(self, batch_id: str,
+                  items: list[tuple[str, ChatRequest]]) -> AsyncIterator[dict]:
+        """
+        Yield a result line for every item: saved results first, then new
+        results as they finish. Failed and over-quota items yield an error
+        line and are retried when the batch is resumed.
+        """
+        saved = await anyio.to_thread.run_sync(self.results, batch_id)
+        for item_id, _ in items:
+            if item_id in saved:
+                BATCH_ITEMS.inc(outcome="resumed")
+                yield saved[item_id]
+        todo = [(item_id, request) for item_id, request in items if item_id not in saved]
+        pending = iter(todo)
+        finished: asyncio.Queue[dict] = asyncio.Queue()
+        settings = self.settings
+
+        async def work(client: Client, limiter: anyio.CapacityLimiter):
+            # Workers share the iterator, so faster backends take more items
+            for item_id, request in pending:
+                try:
+                    line = await anyio.to_thread.run_sync(
+                        self._generate, batch_id, item_id, request, client,
+                        limiter=limiter)
+                    BATCH_ITEMS.inc(outcome="completed")
+                except QuotaExceeded as e:
+                    BATCH_ITEMS.inc(outcome="rejected")
+                    line = {"id": item_id, "error": str(e),
+                            "retry_after": e.quota.retry_after}
+                except Exception as e:
+                    logger.error(f"Batch {batch_id} item {item_id} failed: {e}")
+                    BATCH_ITEMS.inc(outcome="failed")
+                    line = {"id": item_id, "error": str(e)}
+                await finished.put(line)
+
+        workers = [asyncio.create_task(work(self._client(url), self._limiter(url)))
+                   for url in (backend.url for backend in self.backends)
+                   for _ in range(settings.concurrency_per_backend)]
+        try:
+            for _ in todo:
+                yield await finished.get()
+        finally:
+            for worker in workers:
+                worker.cancel()
@@ -0,0 +1,126 @@
+"""
+The lifecycle module counts the requests a worker is serving and publishes
+this worker's metrics to the shared store, so that `/metrics` reports every
+worker on the host.
+
+Draining is left to uvicorn: on shutdown it stops accepting connections,
+closes idle keep-alive connections and waits up to
+`--timeout-graceful-shutdown` seconds for in-flight requests, streams
+included, before the lifespan shutdown runs.
+
+---
+
+This file is part of The KenGPT Project. The KenGPT Project is free software:
+you can redistribute it and/or modify it under the terms of the GNU General
+Public License as published by the Free Software Foundation, either version 3
+of the License, or (at your option) any later version.
+The KenGPT Project is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+details.
+You should have received a copy of the GNU General Public License along with
+The KenGPT Project. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+
+import anyio
+
+from core.metrics import INFLIGHT_REQUESTS, REGISTRY, REQUEST_SECONDS
+from core.store import get_store
+
+logger = logging.getLogger("uvicorn")
+
+METRICS_PUBLISH_INTERVAL = 5.0  # Seconds between metrics snapshots
+METRICS_KEY_PREFIX = "metrics:"
+
+
+class InflightMiddleware:
+    """
+    An ASGI middleware that counts requests in flight. Unlike an HTTP
+    middleware, it only finishes once the response body has been sent, so
+    streaming responses are counted until the stream ends.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        INFLIGHT_REQUESTS.inc()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            INFLIGHT_REQUESTS.inc(-1)
+
+
+class RequestTimeMiddleware:
+    """
+    An ASGI middleware that records the latency of every request against its
+    route template. Like `InflightMiddleware`, it only stops the clock once
+    the last body chunk has been sent, so streams are timed to their end.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router stores the matched route in the shared scope
+            route = scope.get("route")
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=str(status),
+            )
+
+
+def publish_metrics() -> None:
+    """Publish this worker's metrics to the shared store."""
+    get_store().set(
+        f"{METRICS_KEY_PREFIX}{os.getpid()}",
+        REGISTRY.snapshot(),
+        ttl=METRICS_PUBLISH_INTERVAL * 3,
+    )
+
+
+def collect_metrics() -> list[list[list]]:
+    """Return the latest metrics snapshot of every live worker on the host."""
+    publish_metrics()
+    return list(get_store().items(METRICS_KEY_PREFIX).values())
+
+
+async def publish_metrics_forever() -> None:
+    """
+    Periodically publish this worker's metrics until cancelled. Store writes
+    may wait on other workers' transactions, so they run in a worker thread.
+    """
+    while True:
+        try:
+            await anyio.to_thread.run_sync(publish_metrics)
+            await anyio.to_thread.run_sync(get_store().purge)
+        except Exception as e:
+            logger.error(f"Failed to publish metrics: {e}")
+        await asyncio.sleep(METRICS_PUBLISH_INTERVAL)
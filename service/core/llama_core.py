@@ -1,5 +1,4 @@
 
-import os
 import io
 import json
 import logging
@@ -7,16 +6,43 @@ import uuid
 import time
 
 from ollama import chat, Client
-from ollama import Message
 
 from model import ToolBox, FuncTool
-from model.message import ChatContent, ChatRequest, ChatResponse, Role, Status
+from model.message import ChatContent, ChatRequest, ChatResponse, ChatUsage, Role, Status
+from model.system import Configuration
+from core.metrics import CHAT_STAGE_SECONDS, TOOL_CALL_SECONDS, record_ollama_response
+from core.singleflight import SingleFlight, make_key
+from core.store import get_store
+from core.warmup import ModelScheduler
 
 import re
 
-ollama_client = Client(
-    host=os.getenv("OLLAMA_API_URL", "http://localhost:11434"),
-)
+MODELS_KEY_PREFIX = "models:list:"  # Cached model list, per backend URL
+
+# Identical tool calls in flight share one execution
+ToolFlight = SingleFlight("tool")
+
+def call_tool(tool: FuncTool, /, **kwargs) -> str | None:
+    """
+    Call a function tool and record how long it took. Concurrent identical
+    calls to the same tool share one execution unless the tool was registered
+    with `coalesce=False`.
+    """
+    def timed() -> str | None:
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            result = tool(**kwargs)
+            outcome = "ok"
+            return result
+        finally:
+            TOOL_CALL_SECONDS.observe(
+                time.perf_counter() - start, tool=tool.name, outcome=outcome)
+
+    if tool.coalesce:
+        # Tool names are not unique across toolboxes, so key on this tool
+        return ToolFlight.do(make_key(id(tool), kwargs), timed)
+    return timed()
 
 def separate_thought_from_content(text: str) -> tuple[str, str | None]:
     """
@@ -37,31 +63,87 @@ class LlamaCore:
     def __init__(self,
                  system_prompt: str,
                  model: str = "deepseek-r1:7b",
-                 toolboxes: list[ToolBox] | None = None):
+                 toolboxes: list[ToolBox] | None = None,
+                 host: str = "http://localhost:11434",
+                 models_ttl: float = 0.0):
         self.model = model
         self.system_prompt = system_prompt
         self._toolboxes: dict[str, ToolBox] = {
             tbx.name: tbx for tbx in toolboxes} if toolboxes else {}
+        self.host = host
+        self.client = Client(host=host)
+        self.models_ttl = models_ttl
+        self.scheduler = ModelScheduler()
 
-    def get_response(self, request: ChatRequest) -> ChatResponse:
-        """Get a response from the Assistant."""
-        system_message = Message(
-            content=request.profile.instruction,
-            role="system"
-        )
-        request_model = request.profile.model or self.model
-        request_role = "user" if request.role == "user" else "assistant"
-        chat_history = [system_message] + [
-            Message(content=msg.render_text(),
-                    role="user" if msg.role == "user" else "assistant")
+    def configure(self, configuration: Configuration):
+        """
+        Apply a new configuration. The first backend serves chat. Requests
+        already in flight keep using the client they started with.
+        """
+        self.model = configuration.models.default
+        self.system_prompt = configuration.models.system_prompt
+        self.scheduler.configure(configuration)
+        host = configuration.backends[0].url
+        if host != self.host:
+            self.host = host
+            self.client = Client(host=host)
+        if configuration.caches.models_ttl != self.models_ttl:
+            self.models_ttl = configuration.caches.models_ttl
+            get_store().delete(MODELS_KEY_PREFIX + self.host)
+
+    def render_history(self, request: ChatRequest) -> list[dict[str, str]]:
+        """
+        Render the validated request into Ollama chat messages. Plain dicts
+        are used because the Ollama client validates every message into its
+        own `Message` model anyway; building `Message` objects here would
+        validate the whole history twice.
+        """
+        instruction = request.profile.instruction or self.system_prompt
+        chat_history = [{"role": "system", "content": instruction}]
+        chat_history.extend(
+            {"role": msg.role.value, "content": msg.render_text()}
             for msg in request.history
-        ]
-        chat_history.append(
-            Message(content=request.render_text(), role=request_role))
-        response = ollama_client.chat(model=request_model, messages=chat_history)
-        response_content, response_thought = separate_thought_from_content(
-            response.message.content or "I'm sorry. Something went wrong."
         )
+        chat_history.append(
+            {"role": request.role.value, "content": request.render_text()})
+        return chat_history
+
+    def prepare(self, request: ChatRequest) -> tuple[bytes, list[dict[str, str]]]:
+        """
+        Render the request's messages and return them with a key identifying
+        the generation the request asks for: the model and the messages.
+        Requests with equal keys get the same reply, whatever their
+        timestamps or sessions. Rendering and hashing a long history is
+        slow, so call this from a worker thread.
+        """
+        with CHAT_STAGE_SECONDS.time(stage="render_history"):
+            chat_history = self.render_history(request)
+        return make_key(request.profile.model or self.model, chat_history), chat_history
+
+    def get_response(self, request: ChatRequest, client: Client | None = None,
+                     chat_history: list[dict[str, str]] | None = None) -> ChatResponse:
+        """
+        Get a response from the Assistant, generated by the given backend
+        client or by the chat backend. Pass the messages returned by
+        `prepare` as `chat_history` to avoid rendering them again.
+        """
+        request_model = request.profile.model or self.model
+        client = client or self.client
+        if chat_history is None:
+            with CHAT_STAGE_SECONDS.time(stage="render_history"):
+                chat_history = self.render_history(request)
+        self.scheduler.record(request_model)
+        with CHAT_STAGE_SECONDS.time(stage="generate"):
+            response = client.chat(
+                model=request_model,
+                messages=chat_history,
+                keep_alive=self.scheduler.keep_alive(request_model),
+            )
+        record_ollama_response(request_model, response)
+        with CHAT_STAGE_SECONDS.time(stage="split_thought"):
+            response_content, response_thought = separate_thought_from_content(
+                response.message.content or "I'm sorry. Something went wrong."
+            )
         return ChatResponse(
             timestamp=int(time.time() * 1000),
             status=Status.Running,
@@ -74,15 +156,52 @@ class LlamaCore:
             ],
             thoughts=[response_thought] if response_thought else None,
             model_signature=request_model,
-            session_id=request.session_id or uuid.uuid4()
+            session_id=request.session_id or uuid.uuid4(),
+            usage=ChatUsage(
+                prompt_tokens=response.prompt_eval_count or 0,
+                completion_tokens=response.eval_count or 0,
+            ),
         )
     
     def get_models(self) -> list[str]:
-        """Get a list of available models from the Assistant."""
-        response = ollama_client.list()
+        """
+        Get a list of available models from the Assistant, cached for
+        `models_ttl` seconds in the shared store, so that the workers on the
+        host list the models once between them.
+        """
+        key = MODELS_KEY_PREFIX + self.host
+        if self.models_ttl > 0:
+            cached = get_store().get(key)
+            if cached is not None:
+                return cached
+        response = self.client.list()
         all_models = [model.model for model in response.models if model.model]
         # Filter any models that have prefixes (ie. "prefix/model:size")
-        return [model for model in all_models if "/" not in model]
+        models = [model for model in all_models if "/" not in model]
+        if self.models_ttl > 0:
+            get_store().set(key, models, ttl=self.models_ttl)
+        return models
+
+    def warm(self, models: list[str] | None = None) -> list[str]:
+        """
+        Preload the given models, or the models most likely to be used, so
+        the next chat does not wait for a cold load. Failures are logged,
+        since warming up is only ever an optimization.
+        """
+        try:
+            return self.scheduler.warm(self.client, models)
+        except Exception as e:
+            logging.warning(f"Failed to warm up models: {e}")
+            return []
+
+    def call_tool(self, toolbox: str, name: str, /, **kwargs) -> str | None:
+        """Call the named tool of one of the Assistant's toolboxes."""
+        return call_tool(self._toolboxes[toolbox][name], **kwargs)
+
+    def close(self):
+        """Release the resources held by the Assistant's toolboxes."""
+        for toolbox in self._toolboxes.values():
+            toolbox.close()
 
 
     # def add_toolbox(self, toolbox: ToolBox):
@@ -0,0 +1,334 @@
+"""
+The metrics module provides low-overhead counters, gauges and histograms for
+instrumenting the service, and renders them in the Prometheus text exposition
+format. Timers use `time.perf_counter`, a monotonic clock, so measurements
+are not affected by changes to the system clock.
+
+---
+
+This file is part of The KenGPT Project. The KenGPT Project is free software:
+you can redistribute it and/or modify it under the terms of the GNU General
+Public License as published by the Free Software Foundation, either version 3
+of the License, or (at your option) any later version.
+The KenGPT Project is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+details.
+You should have received a copy of the GNU General Public License along with
+The KenGPT Project. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+# Latency buckets in seconds, from sub-millisecond parsing up to slow
+# generations on a cold model.
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0,
+)
+TOKEN_RATE_BUCKETS = (1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0, 160.0, 320.0)
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, int):
+        return str(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Metric:
+    """The common base of all metrics. Samples are keyed by label values."""
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"{self.name} expects labels {self.labelnames}, "
+                f"got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterator[tuple[str, tuple[str, ...], tuple[str, ...], float]]:
+        """Yield `(suffix, labelnames, labelvalues, value)` for every sample."""
+        raise NotImplementedError
+
+    def render(self, samples=None) -> str:
+        """
+        Render this metric in the Prometheus text exposition format, from
+        its own samples or from the given (e.g. merged) samples.
+        """
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        for suffix, names, values, value in samples or self.samples():
+            lines.append(
+                f"{self.name}{suffix}{_format_labels(names, values)} "
+                f"{_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """A monotonically increasing value."""
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        """Increment the counter for the given labels."""
+        if amount < 0:
+            raise ValueError("Counters can only be incremented.")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels: str) -> float:
+        """Return the current value of the counter for the given labels."""
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for values, value in items:
+            yield "_total", self.labelnames, values, value
+
+
+class Gauge(Metric):
+    """A value that can go up and down."""
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        """Set the gauge for the given labels."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        """Increment (or decrement, if negative) the gauge."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels: str) -> float:
+        """Return the current value of the gauge for the given labels."""
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for values, value in items:
+            yield "", self.labelnames, values, value
+
+
+class Histogram(Metric):
+    """
+    Counts observations into cumulative buckets and tracks their sum. Each
+    observation is a binary search and three additions under a lock.
+    """
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., +Inf count], sum
+        self._counts: dict[tuple[str, ...], list[int]] = {}
+        self._sums: dict[tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Record a single observation for the given labels."""
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[index] += 1
+            self._sums[key] += value
+
+    @contextmanager
+    def time(self, **labels: str):
+        """Observe the wall time spent inside the `with` block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: str) -> int:
+        """Return the number of observations for the given labels."""
+        return sum(self._counts.get(self._key(labels), ()))
+
+    def sum(self, **labels: str) -> float:
+        """Return the sum of observations for the given labels."""
+        return self._sums.get(self._key(labels), 0.0)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), self._sums[key])
+                     for key, counts in self._counts.items()]
+        names = self.labelnames + ("le",)
+        for values, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield "_bucket", names, values + (_format_value(bound),), cumulative
+            yield "_count", self.labelnames, values, cumulative
+            yield "_sum", self.labelnames, values, total
+
+
+class Registry:
+    """A collection of metrics rendered together on the `/metrics` endpoint."""
+
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        """Register a metric, refusing duplicate names."""
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered.")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self) -> list[list]:
+        """Return every sample as JSON-serializable lists, for sharing."""
+        return [
+            [metric.name, suffix, list(names), list(values), value]
+            for metric in self._metrics.values()
+            for suffix, names, values, value in metric.samples()
+        ]
+
+    def render(self, snapshots: list[list[list]] | None = None) -> str:
+        """
+        Render every registered metric in the text exposition format. When
+        snapshots from several workers are given, their samples are summed,
+        which is correct for counters, histograms and in-flight gauges.
+        """
+        if snapshots is None:
+            return "\n".join(m.render() for m in self._metrics.values()) + "\n"
+        merged: dict[str, dict[tuple, float]] = {}
+        for snapshot in snapshots:
+            for name, suffix, names, values, value in snapshot:
+                samples = merged.setdefault(name, {})
+                key = (suffix, tuple(names), tuple(values))
+                samples[key] = samples.get(key, 0) + value
+        return "\n".join(
+            metric.render([key + (value,) for key, value in merged[name].items()])
+            for name, metric in self._metrics.items() if name in merged
+        ) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "kengpt_http_request_seconds",
+    "Time spent serving HTTP requests.",
+    ("method", "route", "status"),
+))
+INFLIGHT_REQUESTS = REGISTRY.register(Gauge(
+    "kengpt_inflight_requests",
+    "HTTP requests currently being served, including open streams.",
+))
+CHAT_STAGE_SECONDS = REGISTRY.register(Histogram(
+    "kengpt_chat_stage_seconds",
+    "Time spent in each stage of a chat request.",
+    ("stage",),
+))
+OLLAMA_SECONDS = REGISTRY.register(Histogram(
+    "kengpt_ollama_seconds",
+    "Durations reported by Ollama for each generation phase.",
+    ("model", "phase"),
+))
+OLLAMA_TOKENS = REGISTRY.register(Counter(
+    "kengpt_ollama_tokens",
+    "Tokens processed by Ollama.",
+    ("model", "kind"),
+))
+OLLAMA_TOKENS_PER_SECOND = REGISTRY.register(Histogram(
+    "kengpt_ollama_tokens_per_second",
+    "Generation throughput reported by Ollama per response.",
+    ("model",),
+    buckets=TOKEN_RATE_BUCKETS,
+))
+QUOTA_REJECTIONS = REGISTRY.register(Counter(
+    "kengpt_quota_rejections",
+    "Chat requests rejected because a user exceeded a quota.",
+    ("quota",),
+))
+BATCH_ITEMS = REGISTRY.register(Counter(
+    "kengpt_batch_items",
+    "Batch chat items by outcome (completed, failed, rejected, resumed).",
+    ("outcome",),
+))
+COALESCED_CALLS = REGISTRY.register(Counter(
+    "kengpt_coalesced_calls",
+    "Calls served by waiting on an identical call already in flight.",
+    ("kind",),
+))
+SPEAK_STAGE_SECONDS = REGISTRY.register(Histogram(
+    "kengpt_speak_stage_seconds",
+    "Time spent in each stage of a speech request.",
+    ("stage",),
+))
+TOOL_CALL_SECONDS = REGISTRY.register(Histogram(
+    "kengpt_tool_call_seconds",
+    "Time spent executing assistant tool calls.",
+    ("tool", "outcome"),
+))
+
+
+def record_ollama_response(model: str, response) -> None:
+    """
+    Record the timings and token counts Ollama reports on a chat response.
+    Ollama reports durations in nanoseconds; missing fields are skipped.
+    """
+    for phase in ("load", "prompt_eval", "eval", "total"):
+        duration = getattr(response, f"{phase}_duration", None)
+        if duration:
+            OLLAMA_SECONDS.observe(duration / 1e9, model=model, phase=phase)
+    prompt_tokens = getattr(response, "prompt_eval_count", None)
+    if prompt_tokens:
+        OLLAMA_TOKENS.inc(prompt_tokens, model=model, kind="prompt")
+    completion_tokens = getattr(response, "eval_count", None)
+    if completion_tokens:
+        OLLAMA_TOKENS.inc(completion_tokens, model=model, kind="completion")
+        eval_duration = getattr(response, "eval_duration", None)
+        if eval_duration:
+            OLLAMA_TOKENS_PER_SECOND.observe(
+                completion_tokens / (eval_duration / 1e9), model=model)
@@ -0,0 +1,164 @@
+"""
+The quota module limits how much of the backend a single user can consume.
+Each user, identified by the username of their `ChatProfile`, has two token
+buckets: one refilled at a steady rate of requests, and one refilled with
+prompt and completion tokens over a window. A request is admitted only when
+both buckets have room, so over-quota requests never reach Ollama. The
+tokens a response actually used, as reported by Ollama, are charged after
+it completes.
+
+---
+
+This file is part of The KenGPT Project. The KenGPT Project is free software:
+you can redistribute it and/or modify it under the terms of the GNU General
+Public License as published by the Free Software Foundation, either version 3
+of the License, or (at your option) any later version.
+The KenGPT Project is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+details.
+You should have received a copy of the GNU General Public License along with
+The KenGPT Project. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from core.metrics import QUOTA_REJECTIONS
+from core.store import get_store
+from model.system import Configuration, QuotaSettings
+
+QUOTA_KEY_PREFIX = "quota:"
+
+
+@dataclass
+class Quota:
+    """The state of a user's buckets after a request was admitted or charged."""
+    remaining_requests: int
+    remaining_tokens: int
+    retry_after: float = 0.0  # Seconds until the exhausted bucket has room
+
+    @property
+    def headers(self) -> dict[str, str]:
+        """The response headers describing this quota."""
+        headers = {
+            "X-RateLimit-Remaining-Requests": str(self.remaining_requests),
+            "X-RateLimit-Remaining-Tokens": str(self.remaining_tokens),
+        }
+        if self.retry_after:
+            headers["Retry-After"] = str(math.ceil(self.retry_after))
+        return headers
+
+
+class QuotaExceeded(Exception):
+    """Raised when a user has no room left in one of their buckets."""
+
+    def __init__(self, quota_name: str, quota: Quota):
+        super().__init__(f"The {quota_name} quota is exhausted.")
+        self.quota_name = quota_name
+        self.quota = quota
+
+
+class QuotaManager:
+    """
+    Admits and charges requests against per-user token buckets. Bucket
+    state lives in this process, or in the shared store so that every
+    worker on the host enforces the same quotas.
+    """
+
+    def __init__(self, settings: QuotaSettings | None = None):
+        self.settings = settings or QuotaSettings()
+        self._local: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, configuration: Configuration):
+        """Apply new quota settings; existing usage is kept."""
+        self.settings = configuration.quotas
+
+    def _update(self, username: str, func: Callable[[dict | None], dict]) -> dict:
+        if self.settings.shared:
+            return get_store().update(
+                QUOTA_KEY_PREFIX + username, func, ttl=self.settings.token_window)
+        with self._lock:
+            state = self._local[username] = func(self._local.get(username))
+            return state
+
+    def _refill(self, state: dict | None, now: float) -> dict:
+        """Return the buckets topped up for the time elapsed since the last update."""
+        settings = self.settings
+        if state is None:
+            return {"requests": float(settings.request_burst),
+                    "tokens": float(settings.tokens_per_window),
+                    "updated": now}
+        elapsed = max(0.0, now - state["updated"])
+        return {
+            "requests": min(float(settings.request_burst),
+                            state["requests"] + elapsed * self._request_rate),
+            "tokens": min(float(settings.tokens_per_window),
+                          state["tokens"] + elapsed * self._token_rate),
+            "updated": now,
+        }
+
+    @property
+    def _request_rate(self) -> float:
+        return self.settings.requests_per_minute / 60
+
+    @property
+    def _token_rate(self) -> float:
+        return self.settings.tokens_per_window / self.settings.token_window
+
+    def _quota(self, state: dict, retry_after: float = 0.0) -> Quota:
+        return Quota(
+            remaining_requests=max(0, math.floor(state["requests"])),
+            remaining_tokens=max(0, math.floor(state["tokens"])),
+            retry_after=retry_after,
+        )
+
+    def acquire(self, username: str) -> Quota | None:
+        """
+        Take one request from the user's buckets. Raise `QuotaExceeded` if
+        either bucket is exhausted. Return None when quotas are disabled.
+        """
+        if not self.settings.enabled:
+            return None
+        outcome: dict[str, Any] = {}
+
+        def take(state: dict | None) -> dict:
+            state = self._refill(state, time.time())
+            if state["requests"] < 1:
+                outcome["exceeded"] = "requests"
+                outcome["retry_after"] = (1 - state["requests"]) / self._request_rate
+            elif state["tokens"] <= 0:
+                outcome["exceeded"] = "tokens"
+                outcome["retry_after"] = (1 - state["tokens"]) / self._token_rate
+            else:
+                state["requests"] -= 1
+            return state
+
+        state = self._update(username, take)
+        if "exceeded" in outcome:
+            QUOTA_REJECTIONS.inc(quota=outcome["exceeded"])
+            raise QuotaExceeded(
+                outcome["exceeded"], self._quota(state, outcome["retry_after"]))
+        return self._quota(state)
+
+    def charge(self, username: str, tokens: int) -> Quota | None:
+        """
+        Charge the tokens a response used to the user's token bucket. The
+        bucket may go negative, which holds back the user's next requests
+        until it refills.
+        """
+        if not self.settings.enabled:
+            return None
+
+        def spend(state: dict | None) -> dict:
+            state = self._refill(state, time.time())
+            state["tokens"] -= tokens
+            return state
+
+        return self._quota(self._update(username, spend))
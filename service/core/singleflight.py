@@ -0,0 +1,112 @@
+"""
+The single-flight module collapses identical work that is requested while
+it is already in progress: the first caller runs it, and every caller that
+arrives before it finishes waits for and receives the same result (or
+exception). This saves the backend from generating the same reply, speech
+or tool output several times when browser tabs or users repeat a request.
+Results are shared, so they must not be mutated by callers.
+
+Calls are only coalesced within a worker process.
+
+---
+
+This file is part of The KenGPT Project. The KenGPT Project is free software:
+you can redistribute it and/or modify it under the terms of the GNU General
+Public License as published by the Free Software Foundation, either version 3
+of the License, or (at your option) any later version.
+The KenGPT Project is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+details.
+You should have received a copy of the GNU General Public License along with
+The KenGPT Project. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import threading
+from typing import Any, Awaitable, Callable, Hashable, TypeVar
+
+import orjson
+
+from core.metrics import COALESCED_CALLS
+
+T = TypeVar("T")
+
+
+def make_key(*parts: Any) -> bytes:
+    """
+    Return a compact key identifying the given JSON-serializable parts.
+    Mapping keys are sorted, so equal arguments give equal keys.
+    """
+    return hashlib.blake2b(
+        orjson.dumps(parts, option=orjson.OPT_SORT_KEYS), digest_size=16).digest()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with equal keys. `do` serves blocking code
+    running in threads; `do_async` serves coroutines on the event loop, so
+    waiting callers hold neither a thread nor a generation slot.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self._tasks: dict[Hashable, asyncio.Task] = {}
+
+    def do(self, key: Hashable, func: Callable[..., T], *args, **kwargs) -> T:
+        """Call `func(*args, **kwargs)`, or wait for an identical call in flight."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            COALESCED_CALLS.inc(kind=self.name)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def do_async(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        """
+        Await `func()`, or an identical call in flight. The work runs in its
+        own task, so a caller that disconnects does not cancel it for the
+        others.
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            COALESCED_CALLS.inc(kind=self.name)
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            # Mark the exception retrieved when every caller has gone
+            task.exception()
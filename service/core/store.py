@@ -0,0 +1,152 @@
+"""
+The store module provides a small key-value store with expiry that is shared
+by every worker process on a host through a SQLite database. It is used for
+state that must agree across workers, such as metrics snapshots, while each
+worker keeps its own connections and caches.
+
+Set `KENGPT_STATE_FILE` to the path of the database to share it between
+workers. Without it, each process uses a private in-memory database, which
+is correct for a single worker.
+
+---
+
+This file is part of The KenGPT Project. The KenGPT Project is free software:
+you can redistribute it and/or modify it under the terms of the GNU General
+Public License as published by the Free Software Foundation, either version 3
+of the License, or (at your option) any later version.
+The KenGPT Project is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+details.
+You should have received a copy of the GNU General Public License along with
+The KenGPT Project. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable
+
+import orjson
+
+
+class SharedStore:
+    """
+    A key-value store of JSON-serializable values backed by SQLite. Every
+    operation runs in its own transaction, and `update` performs an atomic
+    read-modify-write across processes.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        if path != ":memory:":
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS store ("
+            " key TEXT PRIMARY KEY,"
+            " value BLOB NOT NULL,"
+            " expires REAL)"
+        )
+
+    def _read(self, key: str, now: float) -> Any | None:
+        row = self._connection.execute(
+            "SELECT value FROM store WHERE key = ? AND (expires IS NULL OR expires > ?)",
+            (key, now),
+        ).fetchone()
+        return orjson.loads(row[0]) if row else None
+
+    def _write(self, key: str, value: Any, ttl: float | None, now: float) -> None:
+        self._connection.execute(
+            "INSERT INTO store (key, value, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires = excluded.expires",
+            (key, orjson.dumps(value), now + ttl if ttl is not None else None),
+        )
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the value stored under the key, unless it has expired."""
+        with self._lock:
+            value = self._read(key, time.time())
+        return default if value is None else value
+
+    def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        """Store a value under the key, expiring after `ttl` seconds if given."""
+        with self._lock:
+            self._write(key, value, ttl, time.time())
+
+    def delete(self, key: str) -> None:
+        """Remove the key from the store."""
+        with self._lock:
+            self._connection.execute("DELETE FROM store WHERE key = ?", (key,))
+
+    def update(self, key: str, func: Callable[[Any | None], Any],
+               ttl: float | None = None) -> Any:
+        """
+        Atomically replace the value under the key with `func(value)` and
+        return the new value. `func` receives None when the key is missing
+        or expired, and must be quick: other workers wait on the write lock.
+        """
+        with self._lock:
+            now = time.time()
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                value = func(self._read(key, now))
+                self._write(key, value, ttl, now)
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        return value
+
+    def items(self, prefix: str) -> dict[str, Any]:
+        """Return every unexpired key and value whose key starts with the prefix."""
+        escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT key, value FROM store WHERE key LIKE ? ESCAPE '\\' "
+                "AND (expires IS NULL OR expires > ?)",
+                (escaped + "%", time.time()),
+            ).fetchall()
+        return {key: orjson.loads(value) for key, value in rows}
+
+    def purge(self) -> None:
+        """Delete every expired key."""
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM store WHERE expires IS NOT NULL AND expires <= ?",
+                (time.time(),))
+
+    def close(self) -> None:
+        """Close the connection to the database."""
+        with self._lock:
+            self._connection.close()
+
+
+_store: SharedStore | None = None
+
+
+def get_store() -> SharedStore:
+    """
+    Return this process's connection to the shared store, opening it on
+    first use. The connection is reopened after a fork, since SQLite
+    connections must not be shared between processes.
+    """
+    global _store
+    if _store is None or _store.pid != os.getpid():
+        _store = SharedStore(os.getenv("KENGPT_STATE_FILE", ":memory:"))
+    return _store
+
+
+def close_store() -> None:
+    """Close this process's connection to the shared store, if open."""
+    global _store
+    if _store is not None and _store.pid == os.getpid():
+        _store.close()
+    _store = None
@@ -0,0 +1,176 @@
+"""
+The warmup module keeps the models users are likely to ask for loaded in
+Ollama, so that switching models does not pay for a cold load on the first
+chat. It scores how often each model is used, with older use decaying over
+a configured half-life, and picks the highest scoring models that fit in
+the memory budget as the hot set. Hot models are preloaded ahead of use and
+requested with a long keep-alive; other loaded models are unloaded as soon
+as they push the loaded total over the budget.
+
+---
+
+This file is part of The KenGPT Project. The KenGPT Project is free software:
+you can redistribute it and/or modify it under the terms of the GNU General
+Public License as published by the Free Software Foundation, either version 3
+of the License, or (at your option) any later version.
+The KenGPT Project is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+details.
+You should have received a copy of the GNU General Public License along with
+The KenGPT Project. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Callable
+
+import anyio
+from ollama import Client
+
+from core.store import get_store
+from model.system import Configuration, WarmupSettings
+
+logger = logging.getLogger("uvicorn")
+
+USAGE_KEY = "models:usage"
+
+
+class ModelScheduler:
+    """
+    Tracks model usage and manages which models Ollama keeps loaded. Usage
+    is kept in the shared store, so every worker schedules from the same
+    scores.
+    """
+
+    def __init__(self, settings: WarmupSettings | None = None):
+        self.settings = settings or WarmupSettings()
+        self._sizes: dict[str, int] = {}  # Bytes of memory used per model
+        self._last_preload = float("-inf")  # When the hot set was last preloaded
+
+    def configure(self, configuration: Configuration):
+        """Apply new warmup settings."""
+        self.settings = configuration.warmup
+
+    def _decay(self, state: dict | None, now: float) -> dict:
+        if state is None:
+            return {"scores": {}, "updated": now}
+        factor = 0.5 ** (max(0.0, now - state["updated"]) / self.settings.usage_half_life)
+        return {
+            "scores": {model: score * factor
+                       for model, score in state["scores"].items()
+                       if score * factor >= 0.01},
+            "updated": now,
+        }
+
+    def record(self, model: str, weight: float = 1.0) -> None:
+        """Count a use of the model."""
+        def add(state: dict | None) -> dict:
+            state = self._decay(state, time.time())
+            state["scores"][model] = state["scores"].get(model, 0.0) + weight
+            return state
+        get_store().update(USAGE_KEY, add)
+
+    def scores(self) -> dict[str, float]:
+        """Return the current, decayed, usage score of every model."""
+        return self._decay(get_store().get(USAGE_KEY), time.time())["scores"]
+
+    def hot_set(self) -> list[str]:
+        """
+        Return the most used models that fit in the memory budget together,
+        most used first. Models of unknown size are assumed to fit.
+        """
+        budget = self.settings.memory_budget_gb * 1024 ** 3
+        hot, used = [], 0
+        for model, _ in sorted(self.scores().items(), key=lambda item: -item[1]):
+            size = self._sizes.get(model, 0)
+            if used + size <= budget:
+                hot.append(model)
+                used += size
+        return hot
+
+    def keep_alive(self, model: str) -> float | str | None:
+        """Return the keep-alive to request the model with."""
+        if not self.settings.enabled:
+            return None
+        if model in self.hot_set():
+            return self.settings.hot_keep_alive
+        return self.settings.cold_keep_alive
+
+    def _loaded(self, client: Client) -> dict[str, int]:
+        """Return the loaded models and their sizes, learning the sizes."""
+        loaded = {model.model: model.size or 0
+                  for model in client.ps().models if model.model}
+        self._sizes.update(loaded)
+        return loaded
+
+    def learn_sizes(self, client: Client) -> None:
+        """Learn the size of every available model from the backend."""
+        for model in client.list().models:
+            if model.model and model.model not in self._sizes:
+                self._sizes[model.model] = model.size or 0
+
+    def warm(self, client: Client, models: list[str] | None = None) -> list[str]:
+        """
+        Preload the given models, or the hot set, that are not yet loaded,
+        making room for them by unloading cold models first. The hot set is
+        preloaded at most once per `preload_interval`. Return the models
+        that were preloaded.
+        """
+        if not self.settings.enabled:
+            return []
+        if models is None:
+            now = time.monotonic()
+            if now - self._last_preload < self.settings.preload_interval:
+                return []
+            self._last_preload = now
+        self.learn_sizes(client)
+        loaded = self._loaded(client)
+        candidates = models if models is not None else self.hot_set()
+        targets = [model for model in candidates
+                   if model not in loaded][:self.settings.max_preload]
+        if not targets:
+            return []
+        self.evict(client, reserve=targets)
+        for model in targets:
+            logger.info(f"Preloading model {model}")
+            client.generate(model=model, keep_alive=self.settings.hot_keep_alive)
+        return targets
+
+    def evict(self, client: Client, reserve: list[str] | None = None) -> list[str]:
+        """
+        Unload the least used models outside the hot set while the loaded
+        models, plus the `reserve` models about to be loaded, exceed the
+        memory budget. Return the models that were unloaded.
+        """
+        if not self.settings.enabled:
+            return []
+        reserve = reserve or []
+        loaded = self._loaded(client)
+        budget = self.settings.memory_budget_gb * 1024 ** 3
+        total = sum(loaded.values()) + sum(self._sizes.get(m, 0) for m in reserve)
+        keep = set(self.hot_set()) | set(reserve)
+        scores = self.scores()
+        evicted = []
+        for model in sorted(loaded, key=lambda m: scores.get(m, 0.0)):
+            if total <= budget:
+                break
+            if model in keep:
+                continue
+            logger.info(f"Unloading cold model {model}")
+            client.generate(model=model, keep_alive=0)
+            total -= loaded[model]
+            evicted.append(model)
+        return evicted
+
+    async def evict_forever(self, get_client: Callable[[], Client]) -> None:
+        """Periodically unload cold models until cancelled."""
+        while True:
+            await asyncio.sleep(self.settings.evict_interval)
+            try:
+                await anyio.to_thread.run_sync(self.evict, get_client())
+            except Exception as e:
+                logger.error(f"Failed to evict cold models: {e}")
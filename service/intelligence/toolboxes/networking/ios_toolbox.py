@@ -60,8 +60,7 @@ def use_cisco_ios_toolbox(username: str, password: str, timeout: int = 300):
     CiscoIOSToolBox.timeout = timeout
     CiscoIOSToolBox.exit_event.clear()
     CiscoIOSToolBox.monitor_thread.start()
-    yield CiscoIOSToolBox
-    CiscoIOSToolBox.exit_event.set()
-    for host in CiscoIOSToolBox.devices:
-        CiscoIOSToolBox.devices[host].connection.disconnect()
-    CiscoIOSToolBox.monitor_thread.join()
+    try:
+        yield CiscoIOSToolBox
+    finally:
+        CiscoIOSToolBox.close()
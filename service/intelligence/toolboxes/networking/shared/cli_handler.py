@@ -46,15 +46,24 @@ class DeviceConnectionToolBoxHandler(ToolBox):
 
 
     def monitor_connections(self):
-        while True:
-            if self.exit_event.is_set():
-                break
-            for host, connection in self.devices.items():
+        while not self.exit_event.wait(10):
+            for host, connection in list(self.devices.items()):
                 if time.time() - connection.last_used > self.timeout:
                     logging.info(
                         f"Closing connection to {host} due to inactivity.")
                     connection.connection.disconnect()
-            time.sleep(10)
+
+    def close(self):
+        """Stop monitoring and disconnect from every device."""
+        self.exit_event.set()
+        for host, device in list(self.devices.items()):
+            try:
+                device.connection.disconnect()
+            except Exception as e:
+                logging.warning(f"Failed to disconnect from {host}: {e}")
+        self.devices.clear()
+        if self.monitor_thread.is_alive():
+            self.monitor_thread.join()
 
     def get_device(self, host: str) -> ManagedDevice:
         if host not in self.devices:
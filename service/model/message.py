@@ -7,10 +7,10 @@ enforce type safety between the server's internal components.
 from __future__ import annotations
 
 from enum import Enum
-from typing import Any, List, Literal
+from typing import List, Literal
 import uuid
 
-from pydantic import BaseModel
+from pydantic import AliasChoices, BaseModel, ConfigDict, Field
 
 
 class Role(str, Enum):
@@ -28,8 +28,11 @@ class Status(str, Enum):
 
 
 class ChatContent(BaseModel):
+    # Strict models skip type coercion, which keeps validating long histories cheap
+    model_config = ConfigDict(strict=True)
+
     format: Literal["text", "table", "image", "audio", "video", "file"]  # The format of the content
-    content: Any  # The content data
+    content: str  # The content data
     description: str | None = None  # The description of the content (optional)
 
 
@@ -45,10 +48,16 @@ class ChatMessage(BaseModel):
         return f"{thought_str}\n{content_str}"
 
 
+class ChatUsage(BaseModel):
+    prompt_tokens: int = 0  # Tokens in the rendered prompt and history
+    completion_tokens: int = 0  # Tokens generated for the response
+
+
 class ChatResponse(ChatMessage):
     session_id: uuid.UUID  # The session ID of the chat
     status: Status  # The status of the chat system
     model_signature: str | None = None  # The model signature of the message (default is Unknown)
+    usage: ChatUsage | None = None  # The tokens used by the backend (if reported)
 
 
 class ChatRequest(ChatMessage):
@@ -67,3 +76,30 @@ class ChatProfile(BaseModel):
     instruction: str
     username: str = "You"
     model: str | None = None
+
+
+class BatchItem(BaseModel):
+    """
+    A line of a batch of chat requests. The line carries either a full
+    `ChatRequest`, or a single prompt asked without history, with an
+    optional profile. Lines named `request_id` and `body`, as in a backlog
+    of requests, are read as an id and a prompt.
+    """
+    id: str | None = Field(default=None, validation_alias=AliasChoices("id", "request_id"))
+    request: ChatRequest | None = None
+    prompt: str | None = Field(default=None, validation_alias=AliasChoices("prompt", "body"))
+    profile: ChatProfile | None = None  # The profile to ask the prompt with
+
+    def to_request(self, timestamp: int) -> ChatRequest:
+        """Return the chat request to generate for this line."""
+        if self.request is not None:
+            return self.request
+        if self.prompt is None:
+            raise ValueError("A batch line needs a request or a prompt.")
+        return ChatRequest(
+            role=Role.User,
+            contents=[ChatContent(format="text", content=self.prompt)],
+            timestamp=timestamp,
+            profile=self.profile or ChatProfile(botname="KenGPT", instruction=""),
+            history=[],
+        )
@@ -1,19 +1,81 @@
 from __future__ import annotations
 from random import randint, random
 
+import os
 from typing import Dict
 from enum import Enum
 from abc import ABC, abstractmethod
 import uuid
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, NonNegativeFloat, NonNegativeInt, PositiveFloat, PositiveInt
 
 
 class ServiceType(str, Enum):
     Chat = "chat"
 
 
+class BackendSettings(BaseModel):
+    """An Ollama server that serves chat models."""
+    name: str = "ollama"
+    url: str = Field(default_factory=lambda: os.getenv(
+        "OLLAMA_API_URL", "http://localhost:11434"))
+
+
+class ModelSettings(BaseModel):
+    default: str = "deepseek-r1:7b"  # Used when a profile names no model
+    system_prompt: str = "Hello! How can I help you today?"
+
+
+class LimitSettings(BaseModel):
+    max_concurrent_generations: PositiveInt = 8  # Per worker
+
+
+class QuotaSettings(BaseModel):
+    """Per-user token-bucket limits, keyed on the profile's username."""
+    enabled: bool = False
+    requests_per_minute: PositiveFloat = 20.0  # Sustained request rate
+    request_burst: PositiveInt = 5  # Requests allowed at once
+    tokens_per_window: PositiveInt = 200_000  # Prompt and completion tokens
+    token_window: PositiveFloat = 3600.0  # Seconds to refill the token bucket
+    shared: bool = True  # Share usage between workers through the state store
+
+
+class WarmupSettings(BaseModel):
+    """Keeps the most used models loaded in Ollama within a memory budget."""
+    enabled: bool = True
+    memory_budget_gb: PositiveFloat = 8.0  # Memory available for loaded models
+    hot_keep_alive: float | str = "30m"  # Keep-alive for models in the hot set
+    cold_keep_alive: float | str = "5m"  # Keep-alive for every other model
+    usage_half_life: PositiveFloat = 3600.0  # Seconds for usage to count half
+    max_preload: NonNegativeInt = 2  # Models loaded ahead of use at once
+    preload_interval: NonNegativeFloat = 30.0  # Seconds between hot set preloads
+    evict_interval: PositiveFloat = 60.0  # Seconds between eviction checks
+
+
+class BatchSettings(BaseModel):
+    """Scheduling of batch chat requests, which run beside interactive chat."""
+    concurrency_per_backend: PositiveInt = 2  # Batch generations per backend at once, per worker
+    max_items: PositiveInt = 10_000  # Lines accepted in one batch
+    result_ttl: PositiveFloat = 86_400.0  # Seconds results are kept for resuming
+
+
+class CacheSettings(BaseModel):
+    models_ttl: NonNegativeFloat = 30.0  # Seconds to cache the list of models
+
+
 class Configuration(BaseModel):
-    services: Dict[ServiceType, Provider]
+    """
+    The service configuration. Everything but the secrets is read from the
+    YAML configuration file and may change while the service runs.
+    """
+    backends: list[BackendSettings] = Field(
+        default_factory=lambda: [BackendSettings()], min_length=1)
+    models: ModelSettings = Field(default_factory=ModelSettings)
+    limits: LimitSettings = Field(default_factory=LimitSettings)
+    quotas: QuotaSettings = Field(default_factory=QuotaSettings)
+    warmup: WarmupSettings = Field(default_factory=WarmupSettings)
+    caches: CacheSettings = Field(default_factory=CacheSettings)
+    batch: BatchSettings = Field(default_factory=BatchSettings)
+    services: Dict[ServiceType, str | None] = {}  # Secrets per service
 
 class Provider(BaseModel, ABC):
     id: uuid.UUID
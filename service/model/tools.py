@@ -19,14 +19,19 @@ class ToolBox:
         self.description = description
         self.functions: dict[str, FuncTool] = {}
 
-    def register(self, args: list[FuncTool.Arg] | None = None):
-        """Register a function as a tool for the Assistant."""
+    def register(self, args: list[FuncTool.Arg] | None = None, coalesce: bool = True):
+        """
+        Register a function as a tool for the Assistant. Concurrent identical
+        calls share one execution unless `coalesce` is False, which tools
+        with side effects should set.
+        """
         def decorator(func: Callable[..., str | None]) -> Callable[..., str | None]:
             tool = FuncTool(
                 name=func.__name__,
                 description=func.__doc__,
                 arguments=args if args is not None else [],
-                callable=func
+                callable=func,
+                coalesce=coalesce
             )
             self.functions[func.__name__] = tool
             return func
@@ -57,6 +62,9 @@ class ToolBox:
         """Call the function with the given name and return the result."""
         return self.functions[name](**kwargs)
 
+    def close(self) -> None:
+        """Release any resources held by the tool box."""
+
 FuncToolArgType = Literal["string", "number", "boolean", "object", "array"]
 
 @dataclass
@@ -67,6 +75,7 @@ class FuncTool:
     callable: Callable[..., str | None]
     description: str | None = None
     cache_file: Path | None = None
+    coalesce: bool = True  # Share one execution between identical calls in flight
 
     @dataclass
     class Arg:
@@ -16,41 +16,207 @@ The KenGPT Project. If not, see <https://www.gnu.org/licenses/>.
 from __future__ import annotations
 
 import logging
+import time
+import uuid
 
-from fastapi import APIRouter, HTTPException
+import anyio
+import orjson
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, ValidationError
 
 from model.message import ChatMessage, ChatRequest, ChatResponse
+from core.batch import BatchError, BatchRunner, batch_key, check_id, parse_batch
 from core.llama_core import LlamaCore
+from core.metrics import CHAT_STAGE_SECONDS
+from core.quota import QuotaExceeded, QuotaManager
+from core.singleflight import SingleFlight
+from model.system import Configuration
+from utils import get_configuration, subscribe_configuration
 
 logger = logging.getLogger("uvicorn")
 
 ChatRouter = APIRouter(prefix="/chat")
 
-ChatCore = LlamaCore(
-    system_prompt="Hello! How can I help you today?",
-    model="deepseek-r1:7b",
-)
+ChatCore = LlamaCore(system_prompt="Hello! How can I help you today?")
+
+# Bounds the generations running at once in this worker; the rest queue
+GenerationLimiter = anyio.CapacityLimiter(1)
+
+Quotas = QuotaManager()
+
+# Identical requests in flight share one generation
+ChatFlight = SingleFlight("chat")
+
+Batches = BatchRunner(ChatCore, Quotas)
 
 
-@ChatRouter.post("", response_model=ChatResponse)
-async def chat(request: ChatRequest) -> ChatResponse | HTTPException:
+def configure(configuration: Configuration):
+    """Apply a (re)loaded configuration to the chat service."""
+    ChatCore.configure(configuration)
+    Quotas.configure(configuration)
+    Batches.configure(configuration)
+    GenerationLimiter.total_tokens = configuration.limits.max_concurrent_generations
+
+
+configure(get_configuration())
+subscribe_configuration(configure)
+
+
+def _inline_schema(model: type[BaseModel]) -> dict:
+    """
+    Return the JSON schema of a model with its definitions inlined, since
+    pydantic's `#/$defs/...` references do not resolve inside the OpenAPI
+    document.
+    """
+    schema = model.model_json_schema()
+    definitions = schema.pop("$defs", {})
+
+    def resolve(node):
+        if isinstance(node, list):
+            return [resolve(value) for value in node]
+        if not isinstance(node, dict):
+            return node
+        resolved = {key: resolve(value) for key, value in node.items() if key != "$ref"}
+        if "$ref" in node:
+            resolved = {**resolve(definitions[node["$ref"].rsplit("/", 1)[-1]]), **resolved}
+        return resolved
+
+    return resolve(schema)
+
+
+def _generate(request: ChatRequest, chat_history: list[dict[str, str]],
+              queued_at: float) -> ChatResponse:
+    """Run the generation in a worker thread, recording the time it queued."""
+    CHAT_STAGE_SECONDS.observe(time.perf_counter() - queued_at, stage="queue_wait")
+    return ChatCore.get_response(request, chat_history=chat_history)
+
+
+@ChatRouter.post(
+    "",
+    response_model=ChatResponse,
+    openapi_extra={"requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": _inline_schema(ChatRequest)}},
+    }},
+)
+async def chat(raw_request: Request) -> Response:
     """
     Process a `ChatRequest` sent by a user into a `ChatResponse` from the
-    AI service.
+    AI service. The body is parsed here, rather than by FastAPI, so the
+    parse and serialization stages can be timed. Validating the raw JSON
+    in pydantic-core and encoding the response with orjson also skips
+    FastAPI's slower `json` and `jsonable_encoder` round trips.
     """
+    body = await raw_request.body()
+    try:
+        with CHAT_STAGE_SECONDS.time(stage="parse"):
+            request = ChatRequest.model_validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
     logger.debug(f"Request: {request}")
     logger.debug(f"{request.profile.username} -> {request.contents[-1].content}")
+    username = request.profile.username
     try:
-        response = ChatCore.get_response(request)
-        return response
+        # Quota updates may wait on other workers' shared store transactions
+        quota = await anyio.to_thread.run_sync(Quotas.acquire, username)
+    except QuotaExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=e.quota.headers)
+
+    async def generate() -> ChatResponse:
+        return await anyio.to_thread.run_sync(
+            _generate, request, chat_history, time.perf_counter(), limiter=GenerationLimiter)
+
+    try:
+        key, chat_history = await anyio.to_thread.run_sync(ChatCore.prepare, request)
+        response = await ChatFlight.do_async(key, generate)
     except Exception as e:
         logger.error(e)
         raise HTTPException(status_code=500, detail="Internal server error")
+    # The reply may be shared with other requests; give this one its own session
+    response = response.model_copy(
+        update={"session_id": request.session_id or uuid.uuid4()})
+    if response.usage:
+        quota = await anyio.to_thread.run_sync(
+            Quotas.charge, username,
+            response.usage.prompt_tokens + response.usage.completion_tokens)
+    with CHAT_STAGE_SECONDS.time(stage="serialize"):
+        return ORJSONResponse(
+            response.model_dump(), headers=quota.headers if quota else None)
+
+
+@ChatRouter.post(
+    "/batch",
+    response_class=StreamingResponse,
+    openapi_extra={"requestBody": {
+        "required": True,
+        "content": {"application/x-ndjson": {"schema": {"type": "string"}}},
+    }},
+)
+async def batch(raw_request: Request, batch_id: str | None = None) -> StreamingResponse:
+    """
+    Generate the responses of a JSONL batch of `BatchItem` lines, streaming
+    a JSONL line per item, `{"id", "response"}` or `{"id", "error"}`, as
+    they finish. Each item is admitted through its user's quota; over-quota
+    items fail with a `retry_after`. The batch id is returned in `X-Batch-Id`; it defaults to a
+    digest of the body, so sending the same batch again resumes it.
+    """
+    body = await raw_request.body()
+    try:
+        if batch_id is not None:
+            check_id(batch_id)
+        items = await anyio.to_thread.run_sync(
+            parse_batch, body, Batches.settings.max_items)
+    except BatchError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    batch_id = batch_id or batch_key(body)
+    logger.info(f"Running batch {batch_id} of {len(items)} requests")
+    lines = (orjson.dumps(line) + b"\n" async for line in Batches.run(batch_id, items))
+    return StreamingResponse(
+        lines, media_type="application/x-ndjson", headers={"X-Batch-Id": batch_id})
+
+
+@ChatRouter.get("/batch/{batch_id}", response_class=Response)
+async def batch_results(batch_id: str) -> Response:
+    """Get the saved results of a batch as JSONL, in no particular order."""
+    try:
+        check_id(batch_id)
+    except BatchError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    results = await anyio.to_thread.run_sync(Batches.results, batch_id)
+    if not results:
+        raise HTTPException(status_code=404, detail="No results saved for this batch.")
+    return Response(
+        b"".join(orjson.dumps(line) + b"\n" for line in results.values()),
+        media_type="application/x-ndjson")
+
 
 @ChatRouter.get("/models", response_model=list[str])
-async def models() -> list[str]:
+async def models(background_tasks: BackgroundTasks) -> list[str]:
+    """
+    Get a list of available models. A client fetching the models is about
+    to chat, so the most used models are preloaded once the list is sent.
+    """
+    background_tasks.add_task(ChatCore.warm)
+    return await anyio.to_thread.run_sync(ChatCore.get_models)
+
+
+class WarmupRequest(BaseModel):
+    model: str | None = None  # The model to preload (default model if not provided)
+
+
+@ChatRouter.post("/warmup", status_code=202)
+async def warmup(request: WarmupRequest, background_tasks: BackgroundTasks) -> dict:
     """
-    Get a list of available models.
+    Preload the model of a profile the user just selected, so their first
+    chat does not wait for the model to load. Only models the backend
+    serves are recorded, so unknown names never enter the usage scores.
     """
-    return ChatCore.get_models()
+    model = request.model or ChatCore.model
+    if model not in await anyio.to_thread.run_sync(ChatCore.get_models):
+        raise HTTPException(status_code=404, detail=f"Unknown model {model!r}.")
+    await anyio.to_thread.run_sync(ChatCore.scheduler.record, model)
+    background_tasks.add_task(ChatCore.warm, [model])
+    return {"model": model}
 
@@ -0,0 +1,39 @@
+"""
+---
+
+This file is part of The KenGPT Project. The KenGPT Project is free software:
+you can redistribute it and/or modify it under the terms of the GNU General
+Public License as published by the Free Software Foundation, either version 3
+of the License, or (at your option) any later version.
+The KenGPT Project is distributed in the hope that it will be useful, but
+WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+details.
+You should have received a copy of the GNU General Public License along with
+The KenGPT Project. If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import anyio
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from core.lifecycle import collect_metrics
+from core.metrics import REGISTRY
+
+MetricsRouter = APIRouter(prefix="/metrics")
+
+
+@MetricsRouter.get("", response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    """
+    Serve the metrics of every worker on the host in the Prometheus text
+    exposition format. Collecting reads and writes the shared store, which
+    may wait on other workers, so it runs in a worker thread.
+    """
+    snapshots = await anyio.to_thread.run_sync(collect_metrics)
+    return PlainTextResponse(
+        REGISTRY.render(snapshots),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -17,15 +17,22 @@ from __future__ import annotations
 
 import logging
 
+import anyio
 from fastapi import APIRouter, Request
 from fastapi.responses import StreamingResponse
 from google.cloud import texttospeech
 import io
 
+from core.metrics import SPEAK_STAGE_SECONDS
+from core.singleflight import SingleFlight
+
 logger = logging.getLogger("uvicorn")
 
 SpeakRouter = APIRouter(prefix="/speak")
 
+# Identical texts in flight share one synthesis
+SpeechFlight = SingleFlight("speak")
+
 def speak_text(text: str) -> bytes:
     """Speak the provided text and return MP3 binary data."""
     client = texttospeech.TextToSpeechClient()
@@ -46,12 +53,15 @@ def speak_text(text: str) -> bytes:
 @SpeakRouter.post("")
 async def serve_speech(request: Request):
     """Serve the synthesized speech as an MP3 file."""
-    data = await request.json()
+    with SPEAK_STAGE_SECONDS.time(stage="parse"):
+        data = await request.json()
     text = data.get("text", "")
     if not text:
         return {"error": "Text is required"}
     
-    mp3_data = speak_text(text)
+    with SPEAK_STAGE_SECONDS.time(stage="synthesize"):
+        mp3_data = await SpeechFlight.do_async(
+            text, lambda: anyio.to_thread.run_sync(speak_text, text))
     return StreamingResponse(
         io.BytesIO(mp3_data),
         media_type="audio/mpeg",
@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+import utils
+
+
+@pytest.fixture
+def config_file(tmp_path, monkeypatch):
+    path = tmp_path / "config.yml"
+    path.write_text("limits:\n  max_concurrent_generations: 2\n")
+    monkeypatch.setattr(utils, "CONFIG_FILE", str(path))
+    monkeypatch.setattr(utils, "_configuration", None)
+    monkeypatch.setattr(utils, "_subscribers", [])
+    return path
+
+
+def _touch(path, text):
+    path.write_text(text)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+def test_reload_applies_changes(config_file):
+    """Test that a changed file replaces the configuration and notifies subscribers."""
+    applied = []
+    utils.subscribe_configuration(applied.append)
+    before = utils.get_configuration()
+    assert before.limits.max_concurrent_generations == 2
+    assert not utils.reload_configuration()
+    _touch(config_file, "limits:\n  max_concurrent_generations: 5\n")
+    assert utils.reload_configuration()
+    assert utils.get_configuration().limits.max_concurrent_generations == 5
+    assert applied == [utils.get_configuration()]
+    assert before.limits.max_concurrent_generations == 2
+
+
+def test_reload_ignores_invalid_file(config_file):
+    """Test that an invalid file keeps the current configuration."""
+    before = utils.get_configuration()
+    _touch(config_file, "limits:\n  max_concurrent_generations: -1\n")
+    assert not utils.reload_configuration()
+    assert utils.get_configuration() is before
@@ -0,0 +1,77 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from core.lifecycle import RequestTimeMiddleware
+from core.metrics import (
+    Counter, Histogram, Registry, OLLAMA_TOKENS, REQUEST_SECONDS, record_ollama_response)
+
+
+def test_histogram_render():
+    """Test that histogram buckets are cumulative and rendered with labels."""
+    histogram = Histogram("test_seconds", "A test histogram.", ("stage",),
+                          buckets=(0.1, 1.0))
+    histogram.observe(0.05, stage="parse")
+    histogram.observe(0.5, stage="parse")
+    histogram.observe(5.0, stage="parse")
+    lines = histogram.render().splitlines()
+    assert '# TYPE test_seconds histogram' in lines
+    assert 'test_seconds_bucket{stage="parse",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="parse",le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{stage="parse",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{stage="parse"} 3' in lines
+    assert histogram.count(stage="parse") == 3
+    assert histogram.sum(stage="parse") == 5.55
+
+
+def test_registry_rejects_duplicates():
+    """Test that a metric name can only be registered once."""
+    registry = Registry()
+    registry.register(Counter("test", "A test counter."))
+    with pytest.raises(ValueError):
+        registry.register(Counter("test", "Another test counter."))
+
+
+def test_record_ollama_response():
+    """Test that Ollama's token counts are accumulated per model."""
+    response = SimpleNamespace(
+        prompt_eval_count=12, prompt_eval_duration=2_000_000,
+        eval_count=40, eval_duration=2_000_000_000,
+        load_duration=None, total_duration=2_100_000_000,
+    )
+    record_ollama_response("test-model", response)
+    assert OLLAMA_TOKENS.get(model="test-model", kind="prompt") == 12
+    assert OLLAMA_TOKENS.get(model="test-model", kind="completion") == 40
+
+
+def test_registry_merges_worker_snapshots():
+    """Test that snapshots from several workers are summed when rendered."""
+    registry = Registry()
+    counter = registry.register(Counter("test", "A test counter.", ("route",)))
+    counter.inc(2, route="/chat")
+    snapshot = registry.snapshot()
+    lines = registry.render([snapshot, snapshot]).splitlines()
+    assert 'test_total{route="/chat"} 4.0' in lines
+
+
+def test_streams_are_timed_to_the_last_chunk():
+    """Test that a streaming response is timed until its body is sent."""
+    application = FastAPI()
+
+    @application.get("/stream")
+    async def stream():
+        async def chunks():
+            yield b"first"
+            await asyncio.sleep(0.2)
+            yield b"last"
+        return StreamingResponse(chunks())
+
+    application.add_middleware(RequestTimeMiddleware)
+    labels = {"method": "GET", "route": "/stream", "status": "200"}
+    before = REQUEST_SECONDS.sum(**labels)
+    assert TestClient(application).get("/stream").content == b"firstlast"
+    assert REQUEST_SECONDS.sum(**labels) - before >= 0.2
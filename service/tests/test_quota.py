@@ -0,0 +1,35 @@
+import pytest
+
+from core.quota import QuotaExceeded, QuotaManager
+from model.system import QuotaSettings
+
+
+def test_disabled_quotas_admit_everything():
+    """Test that nothing is tracked while quotas are disabled."""
+    quotas = QuotaManager(QuotaSettings(enabled=False))
+    assert quotas.acquire("alice") is None
+    assert quotas.charge("alice", 10) is None
+
+
+def test_request_burst_is_enforced_per_user():
+    """Test that a user is limited to their burst while others are not."""
+    quotas = QuotaManager(QuotaSettings(
+        enabled=True, shared=False, request_burst=2, requests_per_minute=1))
+    assert quotas.acquire("alice").remaining_requests == 1
+    assert quotas.acquire("alice").remaining_requests == 0
+    with pytest.raises(QuotaExceeded) as exceeded:
+        quotas.acquire("alice")
+    assert exceeded.value.quota_name == "requests"
+    assert exceeded.value.quota.headers["Retry-After"] == "60"
+    assert quotas.acquire("bob").remaining_requests == 1
+
+
+def test_token_usage_blocks_until_refilled():
+    """Test that charged tokens can exhaust the token bucket."""
+    quotas = QuotaManager(QuotaSettings(
+        enabled=True, shared=False, tokens_per_window=100, token_window=3600))
+    quotas.acquire("alice")
+    assert quotas.charge("alice", 150).remaining_tokens == 0
+    with pytest.raises(QuotaExceeded) as exceeded:
+        quotas.acquire("alice")
+    assert exceeded.value.quota_name == "tokens"
@@ -0,0 +1,133 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from core.llama_core import LlamaCore
+from core.singleflight import SingleFlight, make_key
+from model import FuncTool, ToolBox
+
+
+def test_make_key_ignores_mapping_order():
+    """Test that equal arguments give equal keys."""
+    assert make_key("tool", {"a": 1, "b": 2}) == make_key("tool", {"b": 2, "a": 1})
+    assert make_key("tool", {"a": 1}) != make_key("tool", {"a": 2})
+
+
+def test_concurrent_calls_share_one_execution():
+    """Test that threads calling with the same key run the work once."""
+    flight = SingleFlight("test")
+    calls = []
+    started = threading.Event()
+
+    def work() -> list:
+        calls.append(1)
+        started.set()
+        time.sleep(0.1)
+        return ["result"]
+
+    with ThreadPoolExecutor(4) as pool:
+        first = pool.submit(flight.do, "key", work)
+        started.wait()
+        others = [pool.submit(flight.do, "key", work) for _ in range(3)]
+        results = [first.result()] + [future.result() for future in others]
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    # Finished calls are not cached
+    flight.do("key", work)
+    assert len(calls) == 2
+
+
+def test_errors_reach_every_waiter():
+    """Test that an exception is raised in every coalesced caller."""
+    flight = SingleFlight("test")
+
+    async def fail():
+        await asyncio.sleep(0.05)
+        raise ValueError("backend failed")
+
+    async def main():
+        return await asyncio.gather(
+            *(flight.do_async("key", fail) for _ in range(3)), return_exceptions=True)
+
+    errors = asyncio.run(main())
+    assert all(isinstance(error, ValueError) for error in errors)
+    assert errors[0] is errors[1] is errors[2]
+
+
+def test_cancelled_caller_does_not_cancel_others():
+    """Test that a caller going away leaves the shared work running."""
+    flight = SingleFlight("test")
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return "reply"
+
+    async def main():
+        first = asyncio.create_task(flight.do_async("key", work))
+        second = asyncio.create_task(flight.do_async("key", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == "reply"
+    assert len(calls) == 1
+
+
+def test_tools_with_the_same_name_are_not_shared():
+    """Test that identical calls to different tools of the same name both run."""
+    started = threading.Barrier(2, timeout=5)
+
+    def toolbox(reply: str) -> ToolBox:
+        tools = ToolBox(reply, "Replies with its name.")
+
+        @tools.register(args=[FuncTool.Arg("host", "string")])
+        def wrapper(host: str) -> str:
+            started.wait()
+            return reply
+        return tools
+
+    core = LlamaCore("", toolboxes=[toolbox("first"), toolbox("second")])
+    with ThreadPoolExecutor(2) as pool:
+        results = [pool.submit(core.call_tool, name, "wrapper", host="router")
+                   for name in ("first", "second")]
+        assert [future.result() for future in results] == ["first", "second"]
+
+
+def test_identical_tool_calls_share_one_execution():
+    """Test that concurrent identical calls run a tool once unless it opts out."""
+    calls = []
+    started = threading.Event()
+    tools = ToolBox("lookup", "Looks things up.")
+
+    @tools.register(args=[FuncTool.Arg("name", "string")])
+    def dns_lookup(name: str) -> str:
+        calls.append(name)
+        started.set()
+        time.sleep(0.1)
+        return "192.0.2.1"
+
+    @tools.register(args=[FuncTool.Arg("command", "string")], coalesce=False)
+    def send_command(command: str) -> str:
+        calls.append(command)
+        time.sleep(0.05)
+        return "ok"
+
+    core = LlamaCore("", toolboxes=[tools])
+    with ThreadPoolExecutor(3) as pool:
+        first = pool.submit(core.call_tool, "lookup", "dns_lookup", name="router")
+        assert started.wait(5)
+        others = [pool.submit(core.call_tool, "lookup", "dns_lookup", name="router")
+                  for _ in range(2)]
+        assert {future.result() for future in [first, *others]} == {"192.0.2.1"}
+    assert calls == ["router"]
+    with ThreadPoolExecutor(2) as pool:
+        list(pool.map(lambda _: core.call_tool("lookup", "send_command", command="reload"),
+                      range(2)))
+    assert calls == ["router", "reload", "reload"]
@@ -0,0 +1,37 @@
+import multiprocessing
+import time
+
+from core.store import SharedStore
+
+
+def _increment(path: str, times: int):
+    store = SharedStore(path)
+    for _ in range(times):
+        store.update("counter", lambda value: (value or 0) + 1)
+    store.close()
+
+
+def test_expiry_and_prefix(tmp_path):
+    """Test that expired keys are hidden and prefixes are matched literally."""
+    store = SharedStore(str(tmp_path / "state.sqlite3"))
+    store.set("metrics:1", [1], ttl=60)
+    store.set("metrics:2", [2], ttl=0.01)
+    store.set("metrics_3", [3])
+    time.sleep(0.02)
+    assert store.get("metrics:2") is None
+    assert store.items("metrics:") == {"metrics:1": [1]}
+    store.purge()
+    assert store.get("metrics_3") == [3]
+
+
+def test_update_is_atomic_across_processes(tmp_path):
+    """Test that concurrent workers never lose an update."""
+    path = str(tmp_path / "state.sqlite3")
+    SharedStore(path).close()
+    workers = [multiprocessing.Process(target=_increment, args=(path, 50))
+               for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert SharedStore(path).get("counter") == 200
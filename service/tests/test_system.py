@@ -1,26 +1,177 @@
+import asyncio
 import time
-from server.model.chat import ChatRequest
-from system import System
-
-
-def test_process():
-    """Test the process function of the system."""
-    system = System.get_instance()
-    request = ChatRequest(
-        **{
-            "role": "user",
-            "content": "Hello, world!",
-            "timestamp": int(time.time() * 1000),
-            "settings": {
-                "username": "Test User",
-                "botname": "Test Bot",
-                "instruction": "",
-                "acknowledge": "Understood.",
-            },
-            "memory": [],
-            "fileContent": "",
-        }
-    )
-    response = system.process(request)
-    print(response)
-    assert response["role"] == "assistant"
+
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+from ollama import Client
+
+import app
+from core.batch import BatchRunner, parse_batch
+from core.llama_core import MODELS_KEY_PREFIX
+from core.metrics import BATCH_ITEMS
+from core.store import get_store
+from model.system import BackendSettings, BatchSettings, QuotaSettings
+from route.chat import Batches, ChatCore, Quotas
+from bench.fake_ollama import FakeOllamaSettings, create_fake_ollama, free_port, serve_in_thread
+
+
+@pytest.fixture(scope="module")
+def fake_ollama_url():
+    """Serve a fast fake Ollama backend for the duration of the module."""
+    port = free_port()
+    server = serve_in_thread(
+        create_fake_ollama(FakeOllamaSettings(token_rate=10_000, latency=0)), port)
+    yield f"http://127.0.0.1:{port}"
+    server.should_exit = True
+
+
+@pytest.fixture
+def client(fake_ollama_url, monkeypatch):
+    monkeypatch.setattr(ChatCore, "client", Client(host=fake_ollama_url))
+    monkeypatch.setattr(ChatCore, "host", fake_ollama_url)
+    monkeypatch.setattr(Batches, "backends", [BackendSettings(url=fake_ollama_url)])
+    return TestClient(app.application)
+
+
+def test_chat(client):
+    """Test that a chat request is answered by the assistant."""
+    response = client.post("/chat", json={
+        "role": "user",
+        "contents": [{"format": "text", "content": "Hello, world!"}],
+        "timestamp": int(time.time() * 1000),
+        "profile": {"username": "Test User", "botname": "Test Bot", "instruction": ""},
+        "history": [],
+    })
+    assert response.status_code == 200
+    data = response.json()
+    assert data["role"] == "assistant"
+    assert data["thoughts"] == ["Thinking."]
+    assert data["model_signature"] == "deepseek-r1:7b"
+
+
+def test_chat_rejects_invalid_request(client):
+    """Test that a malformed chat request is rejected before generation."""
+    response = client.post("/chat", json={"role": "user"})
+    assert response.status_code == 422
+
+
+def test_openapi_request_schema_resolves(client):
+    """Test that the hand-declared chat request schema has no dangling references."""
+    response = client.get("/openapi.json")
+    assert response.status_code == 200
+    assert "#/$defs/" not in response.text
+    body = response.json()["paths"]["/chat"]["post"]["requestBody"]
+    schema = body["content"]["application/json"]["schema"]
+    assert "botname" in schema["properties"]["profile"]["properties"]
+
+
+def test_models(client):
+    """Test that the models served by the backend are listed."""
+    response = client.get("/chat/models")
+    assert response.status_code == 200
+    assert "deepseek-r1:7b" in response.json()
+
+
+def test_models_are_cached_in_shared_store(client, fake_ollama_url):
+    """Test that the model list is cached where every worker can read it."""
+    get_store().set(MODELS_KEY_PREFIX + fake_ollama_url, ["cached:1b"], ttl=60)
+    try:
+        assert client.get("/chat/models").json() == ["cached:1b"]
+    finally:
+        get_store().delete(MODELS_KEY_PREFIX + fake_ollama_url)
+
+
+def test_warmup_accepts_only_served_models(client):
+    """Test that only models the backend serves are recorded and preloaded."""
+    response = client.post("/chat/warmup", json={"model": "no-such-model:1b"})
+    assert response.status_code == 404
+    assert "no-such-model:1b" not in ChatCore.scheduler.scores()
+    response = client.post("/chat/warmup", json={"model": "llama3.2:3b"})
+    assert response.status_code == 202
+    assert "llama3.2:3b" in ChatCore.scheduler.scores()
+
+
+def test_batch_streams_and_resumes(client):
+    """Test that a batch answers every line and resumes from saved results."""
+    request = {
+        "role": "user",
+        "contents": [{"format": "text", "content": "Hello, world!"}],
+        "timestamp": int(time.time() * 1000),
+        "profile": {"botname": "Test Bot", "instruction": ""},
+        "history": [],
+    }
+    body = b"\n".join(orjson.dumps(line) for line in [
+        {"id": "full", "request": request},
+        {"prompt": "Hello?", "profile": {"botname": "Test Bot", "instruction": "Be brief."}},
+        {"request_id": "backlog-1", "title": "A request", "body": "Say hello."},
+    ])
+    response = client.post("/chat/batch", content=body)
+    assert response.status_code == 200
+    results = [orjson.loads(line) for line in response.text.splitlines()]
+    assert sorted(result["id"] for result in results) == ["2", "backlog-1", "full"]
+    assert all(result["response"]["role"] == "assistant" for result in results)
+
+    resumed = BATCH_ITEMS.get(outcome="resumed")
+    again = client.post("/chat/batch", content=body)
+    assert again.headers["X-Batch-Id"] == response.headers["X-Batch-Id"]
+    assert len(again.text.splitlines()) == 3
+    assert BATCH_ITEMS.get(outcome="resumed") == resumed + 3
+
+    saved = client.get(f"/chat/batch/{response.headers['X-Batch-Id']}")
+    assert len(saved.text.splitlines()) == 3
+
+
+def test_batch_rejects_invalid_line(client):
+    """Test that a batch with an invalid line is rejected before generation."""
+    response = client.post("/chat/batch", content=b'{"prompt": "Hi"}\n{"id": "x"}')
+    assert response.status_code == 422
+    assert "Line 2" in response.json()["detail"]
+
+
+def test_batch_rejects_ids_with_separator(client):
+    """Test that ids that could reach another batch's results are rejected."""
+    response = client.post("/chat/batch", content=b'{"id": "a:b", "prompt": "Hi"}')
+    assert response.status_code == 422
+    assert "Line 1" in response.json()["detail"]
+    response = client.post("/chat/batch?batch_id=a:b", content=b'{"prompt": "Hi"}')
+    assert response.status_code == 422
+    assert client.get("/chat/batch/a:b").status_code == 422
+
+
+def test_batches_share_the_backend_limit():
+    """Test that concurrent batches together stay within the per-backend limit."""
+    fake = create_fake_ollama(FakeOllamaSettings(token_rate=1_000, latency=0.02))
+    port = free_port()
+    server = serve_in_thread(fake, port)
+    try:
+        runner = BatchRunner(ChatCore, settings=BatchSettings(concurrency_per_backend=1))
+        runner.backends = [BackendSettings(url=f"http://127.0.0.1:{port}")]
+        body = b"\n".join(orjson.dumps({"prompt": f"Question {i}"}) for i in range(3))
+
+        async def run(batch_id: str) -> list[dict]:
+            return [line async for line in runner.run(batch_id, parse_batch(body, 10))]
+
+        async def main():
+            return await asyncio.gather(run("limit-first"), run("limit-second"))
+
+        first, second = asyncio.run(main())
+    finally:
+        server.should_exit = True
+    assert all("response" in line for line in first + second)
+    assert fake.state.peak == 1
+
+
+def test_batch_items_are_admitted_through_quotas(client, monkeypatch):
+    """Test that batch items over the user's quota never reach the backend."""
+    monkeypatch.setattr(Quotas, "settings", QuotaSettings(
+        enabled=True, request_burst=1, requests_per_minute=1, shared=False))
+    profile = {"botname": "Test Bot", "instruction": "", "username": "batch-quota"}
+    body = b"\n".join(orjson.dumps({"prompt": f"Question {i}", "profile": profile})
+                      for i in range(3))
+    response = client.post("/chat/batch", content=body)
+    results = [orjson.loads(line) for line in response.text.splitlines()]
+    assert sum("response" in result for result in results) == 1
+    rejected = [result for result in results if "error" in result]
+    assert len(rejected) == 2
+    assert all(result["retry_after"] > 0 for result in rejected)
@@ -0,0 +1,45 @@
+import pytest
+from ollama import Client
+
+import core.store
+from bench.fake_ollama import FakeOllamaSettings, create_fake_ollama, free_port, serve_in_thread
+from core.store import SharedStore
+from core.warmup import ModelScheduler
+from model.system import WarmupSettings
+
+
+@pytest.fixture
+def fake_ollama():
+    """Serve a fake Ollama backend whose models use 4 GiB each."""
+    app = create_fake_ollama(FakeOllamaSettings(model_size=4 * 1024 ** 3))
+    port = free_port()
+    server = serve_in_thread(app, port)
+    yield app, Client(host=f"http://127.0.0.1:{port}")
+    server.should_exit = True
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    monkeypatch.setattr(core.store, "_store", SharedStore())
+    return ModelScheduler(WarmupSettings(memory_budget_gb=6))
+
+
+def test_hot_set_fits_budget(fake_ollama, scheduler):
+    """Test that only the most used models that fit the budget are hot."""
+    _, client = fake_ollama
+    scheduler.learn_sizes(client)
+    scheduler.record("llama3.2:3b")
+    scheduler.record("deepseek-r1:7b", weight=2)
+    assert scheduler.hot_set() == ["deepseek-r1:7b"]
+    assert scheduler.keep_alive("deepseek-r1:7b") == "30m"
+    assert scheduler.keep_alive("llama3.2:3b") == "5m"
+
+
+def test_warm_evicts_cold_models(fake_ollama, scheduler):
+    """Test that preloading a hot model unloads a cold one to stay in budget."""
+    app, client = fake_ollama
+    client.generate(model="llama3.2:3b")
+    scheduler.record("deepseek-r1:7b")
+    assert scheduler.warm(client) == ["deepseek-r1:7b"]
+    assert set(app.state.loaded) == {"deepseek-r1:7b"}
+    assert scheduler.warm(client) == []
@@ -17,12 +17,14 @@ The KenGPT Project. If not, see <https://www.gnu.org/licenses/>.
 """
 
 from __future__ import annotations
+import asyncio
 import os
 
 import time
 import logging
+from typing import Callable
 
-from yaml import safe_load, FullLoader
+from yaml import safe_load
 from model.system import Configuration, ServiceType
 
 logger = logging.getLogger("uvicorn")
@@ -31,9 +33,9 @@ logger = logging.getLogger("uvicorn")
 def display_time(func: callable) -> callable:
     def wrapper(*args, **kwargs):
         logger.debug(f"Running {func.__name__}...")
-        start = time.time()
+        start = time.perf_counter()
         result = func(*args, **kwargs)
-        elapsed = time.time() - start
+        elapsed = time.perf_counter() - start
         elapsed_str = (
             f"{elapsed:.2f} seconds"
             if elapsed < 60 else f"{elapsed / 60:.2f} minutes"
@@ -43,24 +45,24 @@ def display_time(func: callable) -> callable:
 
     return wrapper
 
+CONFIG_FILE = os.getenv("KENGPT_CONFIG_FILE", "config.yml")
+CONFIG_POLL_INTERVAL = 2.0  # Seconds between checks for a changed file
+
 _configuration: Configuration | None = None
+_configuration_mtime: int | None = None
+_subscribers: list[Callable[[Configuration], None]] = []
 
-def get_configuration() -> Configuration:
+
+def read_secrets() -> dict[str, str | None]:
     """
-    Assemble a `Configuration` object from Docker secrets and environment
-    variables. Prefer Docker secrets over environment variables. Provide
-    default values for missing configuration. Cache the configuration in
-    a global variable to avoid re-reading the secrets and environment
-    variables.
+    Read the secret of every service from Docker secrets or environment
+    variables, preferring Docker secrets.
     ENVIRONMENT VARIABLES:
     `{category}_{type}_FILE`: The file path to the secret for the given
     category and type.
     `{category}_{type}`: The secret value for the given category and
     type.
     """
-    global _configuration
-    if _configuration:
-        return _configuration
     # TODO: Implement external secret management
     def check_for_value(t: ServiceType) -> str:
         # Check for the environment variables pointing to the secrets
@@ -73,6 +75,78 @@ def get_configuration() -> Configuration:
         if value:
             return value
         return value
-    _configuration = Configuration({t.value:check_for_value(t)
-                                    for t in ServiceType})
+    return {t.value: check_for_value(t) for t in ServiceType}
+
+
+def load_configuration(path: str = CONFIG_FILE) -> Configuration:
+    """
+    Assemble a `Configuration` object from the YAML configuration file and
+    the secrets. Provide default values for anything the file leaves out,
+    or for everything if the file does not exist.
+    """
+    data = {}
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            data = safe_load(f) or {}
+    if not isinstance(data, dict):
+        raise ValueError(f"{path} must contain a mapping of settings.")
+    return Configuration(**data, services=read_secrets())
+
+
+def get_configuration() -> Configuration:
+    """
+    Return the current `Configuration`, loading it on first use. The
+    returned object is never modified; a reload replaces it, so callers
+    holding a reference see one consistent configuration.
+    """
+    global _configuration, _configuration_mtime
+    if _configuration is None:
+        _configuration_mtime = _mtime(CONFIG_FILE)
+        _configuration = load_configuration(CONFIG_FILE)
     return _configuration
+
+
+def subscribe_configuration(callback: Callable[[Configuration], None]) -> None:
+    """Call `callback` with the new `Configuration` after every reload."""
+    _subscribers.append(callback)
+
+
+def reload_configuration() -> bool:
+    """
+    Reload the configuration file if it changed since it was last read.
+    An invalid file is logged and ignored, keeping the current configuration.
+    Return whether a new configuration was applied.
+    """
+    global _configuration, _configuration_mtime
+    get_configuration()
+    mtime = _mtime(CONFIG_FILE)
+    if mtime == _configuration_mtime:
+        return False
+    _configuration_mtime = mtime
+    try:
+        configuration = load_configuration(CONFIG_FILE)
+    except Exception as e:
+        logger.error(f"Ignoring invalid configuration in {CONFIG_FILE}: {e}")
+        return False
+    _configuration = configuration
+    logger.info(f"Reloaded configuration from {CONFIG_FILE}")
+    for callback in _subscribers:
+        try:
+            callback(configuration)
+        except Exception as e:
+            logger.error(f"Failed to apply configuration to {callback}: {e}")
+    return True
+
+
+async def watch_configuration() -> None:
+    """Reload the configuration whenever the file changes, until cancelled."""
+    while True:
+        await asyncio.sleep(CONFIG_POLL_INTERVAL)
+        reload_configuration()
+
+
+def _mtime(path: str) -> int | None:
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
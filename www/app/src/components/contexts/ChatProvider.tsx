@@ -6,6 +6,7 @@ import {
   Status,
   submitRequest,
   getAvailableModels,
+  warmModel,
   ChatMessage,
   ChatProfiles,
   ChatRequest,
@@ -86,6 +87,8 @@ export const ChatProvider: FC<{ children: React.ReactNode }> = ({
       });
       // Update the profile in the local storage.
       window.localStorage.setItem("profile", JSON.stringify(profile));
+      // Preload the profile's model; failing to do so only costs latency.
+      warmModel(profile.model).catch(() => {});
     }
   }, [profile]);
 
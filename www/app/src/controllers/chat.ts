@@ -104,4 +104,9 @@ export async function submitRequest(request: ChatRequest) {
 export async function getAvailableModels() {
   const response = await axios.get("/api/chat/models");
   return response.data;
-}
\ No newline at end of file
+}
+
+// Ask the server to preload the model of a profile before it is first used.
+export async function warmModel(model?: string) {
+  await axios.post("/api/chat/warmup", { model });
+}